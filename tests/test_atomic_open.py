@@ -0,0 +1,59 @@
+"""`atomic_open` replaces files in one step, with the permissions an ordinary write would give them."""
+
+from utils import atomic_open, atomic_write_text
+import os
+import stat
+
+import pytest
+
+
+def get_permissions(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def test_new_file_permissions(tmp_path):
+    path = atomic_write_text(tmp_path / "new.json", "{}")
+
+    assert path.read_text() == "{}"
+    assert get_permissions(path) == 0o666 & ~get_umask()
+
+
+def test_replaced_file_keeps_permissions(tmp_path):
+    path = tmp_path / "existing.json"
+    path.write_text("old")
+    os.chmod(path, 0o640)
+
+    atomic_write_text(path, "new")
+
+    assert path.read_text() == "new"
+    assert get_permissions(path) == 0o640
+
+
+def test_not_kept(tmp_path):
+    path = tmp_path / "existing.json"
+    path.write_text("old")
+
+    with atomic_open(path, keep=lambda: False) as f:
+        f.write("new")
+
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["existing.json"]
+
+
+def test_error_leaves_file(tmp_path):
+    path = tmp_path / "existing.json"
+    path.write_text("old")
+
+    with pytest.raises(RuntimeError):
+        with atomic_open(path) as f:
+            f.write("new")
+            raise RuntimeError("interrupted")
+
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["existing.json"]
@@ -0,0 +1,173 @@
+"""`clean_data` resolves its columns for all rows at once, and has to give the same result as the row-wise resolvers it
+replaced (kept below as the reference)."""
+
+from utils.network import clean_data
+import datetime
+import re
+
+import pandas as pd
+import pytest
+
+
+FORBIDDEN = ["?", "[", "]"]
+
+
+def get_performer(row, null_value=""):
+    first_name = row["Performer first-name"]
+    last_name = row["Performer last-name"]
+
+    returnVal = None
+
+    if not returnVal and (last_name and not first_name):
+        returnVal = last_name
+
+    if not returnVal and (
+        row["Normalized performer"]
+        and not "—" in row["Normalized performer"]
+        and not "–" in row["Normalized performer"]
+    ):
+        returnVal = row["Normalized performer"]
+
+    if not returnVal and (first_name and last_name):
+        if not "—" in first_name and not "—" in last_name:
+            returnVal = f"{first_name} {last_name}"
+
+        elif not "—" in last_name and "—" in first_name:
+            returnVal = last_name
+
+        elif not "—" in first_name and "—" in last_name:
+            returnVal = first_name
+
+    if not returnVal and row["Performer"]:
+        returnVal = row["Performer"]
+
+    if not returnVal:
+        return null_value
+
+    return "".join([x for x in returnVal if not x in FORBIDDEN])
+
+
+def get_city(row, null_value=""):
+    for r in ["Normalized City", "City"]:
+        if row[r]:
+            return row[r]
+
+    return null_value
+
+
+def get_unique_venue(row, null_value=""):
+    if row["Normalized Venue"] and row["City"]:
+        return row["Normalized Venue"] + " (" + row["City"] + ")"
+
+    if row["Venue"] and row["City"]:
+        return row["Venue"] + " (" + row["City"] + ")"
+
+    for r in ["Venue", "City"]:
+        if row[r]:
+            return row[r]
+
+    return null_value
+
+
+def get_source(row, null_value=""):
+    for r in ["Source clean", "Source"]:
+        if row[r]:
+            g = re.search(r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)", row[r])
+            if not g:
+                g = re.search(r"\d{4}-\d{2}-\d{2}", row[r])
+                if not g:
+                    return f"{row[r]} ({datetime.datetime.strptime(row['Date'], '%Y-%m-%d').strftime('%B %d, %Y')})"
+            return row[r]
+
+    return (null_value,)
+
+
+def get_revue(row, null_value=""):
+    for r in ["Normalized Revue Name", "Revue name"]:
+        if row[r]:
+            return row[r]
+
+    return null_value
+
+
+def reference_clean_data(df, drop_cols=[]):
+    df["Performer"] = df.apply(lambda row: get_performer(row), axis=1)
+    df["City"] = df.apply(lambda row: get_city(row), axis=1)
+    df["Source"] = df.apply(lambda row: get_source(row), axis=1)
+    df["Revue"] = df.apply(lambda row: get_revue(row), axis=1)
+    df["Unique venue"] = df.apply(lambda row: get_unique_venue(row), axis=1)
+
+    for col in drop_cols:
+        del df[col]
+
+    return df.rename(columns={"Unique venue": "Venue"})
+
+
+COLUMNS = [
+    "Performer",
+    "Performer first-name",
+    "Performer last-name",
+    "Normalized performer",
+    "Venue",
+    "Normalized Venue",
+    "City",
+    "Normalized City",
+    "Source",
+    "Source clean",
+    "Date",
+    "Revue name",
+    "Normalized Revue Name",
+]
+
+# One row per case, in the order of `COLUMNS`
+ROWS = [
+    # Full names, normalized values for everything
+    ["Jean Malin", "Jean", "Malin", "Jean Malin", "Club Abbey", "Abbey Club", "New York", "New York, NY", "Daily News, Jan 5, 1931", "Daily News", "1931-01-05", "Pansies", "Pansy Parade"],
+    # Only a last name, or only a first name
+    ["", "", "Malin", "", "Club Abbey", "", "New York", "", "Variety", "", "1931-02-01", "", ""],
+    ["Karyl", "Karyl", "", "", "Club Abbey", "", "New York", "", "", "Variety", "1931-02-01", "", ""],
+    # Dashes in the names (both kinds), in every combination
+    ["", "—", "Norman", "", "Venue", "", "Boston", "", "Globe", "", "1932-03-04", "—", ""],
+    ["", "Karyl", "—", "", "Venue", "", "Boston", "", "Globe", "", "1932-03-04", "", "—"],
+    ["", "—", "—", "—", "Venue", "", "Boston", "", "Globe", "", "1932-03-04", "", ""],
+    ["Francis Renault", "", "", "Renault –", "Venue", "", "", "Boston, MA", "", "", "1932-03-04", "", ""],
+    ["Gene Dennis", "Gene", "Dennis", "Gene — Dennis", "", "", "Chicago", "", "Tribune", "", "1933-12-31", "", ""],
+    # Forbidden characters
+    ["Bert [Savoy]?", "", "", "", "", "Normalized only", "", "", "Tribune", "Tribune 1933-12-31", "1933-12-31", "", ""],
+    ["", "Rae?", "Bourbon]", "", "Venue", "", "", "", "Tribune", "", "1933-12-31", "", ""],
+    ["", "", "", "[Unnamed?]", "", "", "Chicago", "", "Tribune, 1933-12-31", "", "1933-12-31", "", ""],
+    # Missing sources, venues, cities and performers
+    ["Jackie Maye", "", "", "", "Venue", "", "Chicago", "", "", "", "1934-07-04", "", ""],
+    ["", "", "", "", "", "", "", "", "", "", "1934-07-04", "", ""],
+    ["", "", "", "", "Venue only", "", "", "", "", "", "1934-07-04", "", ""],
+    # Sources with and without dates, and dates in other months and years
+    ["Ray Bourbon", "", "", "", "Venue", "", "Chicago", "", "Source in May", "", "1935-05-10", "", ""],
+    ["Ray Bourbon", "", "", "", "Venue", "", "Chicago", "", "Source", "", "1936-11-30", "", ""],
+    ["Ray Bourbon", "", "", "", "Venue", "", "Chicago", "", "Source", "Clean source", "1936-11-30", "", ""],
+]
+
+
+# Like `get_clean_network_data`, which drops the columns that the cleaned-up ones are made from
+DROP_COLS = ["Venue", "Normalized Venue", "Normalized City", "Source clean", "Revue name", "Normalized Revue Name"]
+
+
+def get_frame():
+    return pd.DataFrame(ROWS, columns=COLUMNS)
+
+
+@pytest.mark.parametrize("column", ["Performer", "City", "Source", "Revue", "Venue"])
+def test_clean_data_equals_row_wise_resolvers(column):
+    expected = reference_clean_data(get_frame(), drop_cols=DROP_COLS)
+    result = clean_data(get_frame(), drop_cols=DROP_COLS, verbose=False)
+
+    assert result[column].tolist() == expected[column].tolist()
+
+
+def test_clean_data_on_larger_frame():
+    df = pd.concat([get_frame()] * 50, ignore_index=True)
+    df = df.sample(frac=1, random_state=1).reset_index(drop=True)
+
+    expected = reference_clean_data(df.copy(), drop_cols=DROP_COLS)
+    result = clean_data(df.copy(), drop_cols=DROP_COLS, verbose=False)
+
+    assert result.to_json(orient="records") == expected.to_json(orient="records")
@@ -0,0 +1,17 @@
+"""`python -m utils` and `sync-data.py` reject the options they do not know."""
+
+from utils.__main__ import get_parser
+
+import pytest
+
+
+def test_force_is_repeatable():
+    args = get_parser().parse_args(["network", "--force", "networks", "--force", "analytics"])
+
+    assert args.command == "network"
+    assert args.force == ["networks", "analytics"]
+
+
+def test_mistyped_option_is_an_error():
+    with pytest.raises(SystemExit):
+        get_parser().parse_args(["network", "--froce", "networks"])
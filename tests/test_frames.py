@@ -0,0 +1,82 @@
+"""`save_frame` stores the clean network data as Feather, and `load_frame` gives back the same frame."""
+
+from utils import load_frame, save_frame
+from utils.network import get_clean_network_data
+from utils.sources import SourceCache
+import utils.sources
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from .test_clean_data import COLUMNS, ROWS
+
+
+def assert_same_frame(result, expected):
+    pd.testing.assert_frame_equal(result, expected)
+    for col in expected.columns:
+        assert [type(x) for x in result[col]] == [type(x) for x in expected[col]], col
+
+
+def test_mixed_columns_round_trip(tmp_path):
+    df = pd.DataFrame(
+        {
+            "Source": ["Variety", ("",), "Tribune", ("",)],
+            "Unsure whether drag artist": [False, "", True, ""],
+            "Date": ["1931-01-05", "1931-02-01", None, "1932-03-04"],
+        }
+    )
+
+    path = save_frame(df, tmp_path / "frame")
+
+    assert path.suffix == ".feather"
+    assert_same_frame(load_frame(tmp_path / "frame"), df)
+
+
+def test_unsupported_values_fall_back_to_pickle(tmp_path):
+    df = pd.DataFrame({"Source": ["Variety", ("a", "b")]})
+
+    path = save_frame(df, tmp_path / "frame")
+
+    assert path.suffix == ".pickle"
+    assert_same_frame(load_frame(tmp_path / "frame"), df)
+
+
+def test_clean_network_data_round_trip(tmp_path, monkeypatch):
+    # The sheet's columns, with the checkboxes as `TRUE`/`FALSE` or blank
+    rows = [row + ["FALSE" if i % 3 else "", ""] for i, row in enumerate(ROWS)]
+    source = tmp_path / "sheet.csv"
+    pd.DataFrame(
+        rows, columns=COLUMNS + ["Unsure whether drag artist", "Exclude from visualization"]
+    ).to_csv(source, index=False)
+    monkeypatch.setattr(utils.sources, "_source_cache", SourceCache(directory=tmp_path / "sources"))
+
+    df = get_clean_network_data(url=str(source), cache_dir=tmp_path / "network", verbose=False)
+
+    assert set(map(type, df["Source"])) == {str, tuple}
+    assert set(map(type, df["Unsure whether drag artist"])) == {bool, str}
+    assert [x.suffix for x in (tmp_path / "network").iterdir()] == [".feather"]
+    assert_same_frame(
+        get_clean_network_data(url=str(source), cache_dir=tmp_path / "network", verbose=False), df
+    )
+
+
+def test_only_the_last_clean_network_data_is_kept(tmp_path, monkeypatch):
+    source = tmp_path / "sheet.csv"
+    pd.DataFrame(
+        [row + ["", ""] for row in ROWS],
+        columns=COLUMNS + ["Unsure whether drag artist", "Exclude from visualization"],
+    ).to_csv(source, index=False)
+    monkeypatch.setattr(utils.sources, "_source_cache", SourceCache(directory=tmp_path / "sources"))
+    cache_dir = tmp_path / "network"
+    cache_dir.mkdir()
+    (cache_dir / "clean-network-data-0123.pickle").write_bytes(b"")  # from an earlier sheet
+
+    get_clean_network_data(url=str(source), cache_dir=cache_dir, verbose=False)
+    files = list(cache_dir.iterdir())
+    get_clean_network_data(url=str(source), cache_dir=cache_dir, skip_unsure=True, verbose=False)
+
+    assert len(files) == 1
+    assert len(list(cache_dir.iterdir())) == 1
+    assert list(cache_dir.iterdir()) != files
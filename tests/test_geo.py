@@ -0,0 +1,42 @@
+"""`geocode_cities` counts the cities it finds in the geo cache as hits and the ones it geocodes as misses."""
+
+from utils.geo import GeoCache, StubGeocoder, geocode_cities
+import datetime
+
+
+def geocode(cities, geo_cache, geocoder):
+    return geocode_cities(
+        cities, geo_cache, geocoder, workers=1, requests_per_second=0, retries=0, verbose=False
+    )
+
+
+def test_hits_and_misses(tmp_path):
+    geo_cache = GeoCache(tmp_path / "geo-cache.json")
+    geocoder = StubGeocoder(known={"Berlin": {"lat": "52.5", "lon": "13.4", "boundingbox": []}})
+
+    counts = geocode(["Berlin", "Atlantis", "Berlin"], geo_cache, geocoder)
+
+    assert counts == {"geocoded": 1, "failed": 1, "errors": 0}
+    assert (geo_cache.hits, geo_cache.misses) == (0, 2)
+
+    # Both are cached now, the failure included
+    counts = geocode(["Berlin", "Atlantis", "Paris"], geo_cache, geocoder)
+
+    assert counts == {"geocoded": 0, "failed": 1, "errors": 0}
+    assert (geo_cache.hits, geo_cache.misses) == (2, 3)
+    assert geocoder.calls == 3
+
+    # Looking the cities up afterwards does not count again
+    assert geo_cache.get("Berlin")["lat"] == "52.5"
+    assert geo_cache.get("Atlantis") == {}
+    assert (geo_cache.hits, geo_cache.misses) == (2, 3)
+
+
+def test_expired_failure_is_a_miss(tmp_path):
+    geo_cache = GeoCache(tmp_path / "geo-cache.json", failure_ttl=datetime.timedelta(days=30))
+    geo_cache.data["Atlantis"] = {"failed": "2000-01-01 00:00:00"}
+
+    geocode(["Atlantis"], geo_cache, StubGeocoder())
+
+    assert (geo_cache.hits, geo_cache.misses) == (0, 1)
+    assert "lat" in geo_cache.data["Atlantis"]
@@ -0,0 +1,59 @@
+"""`group_dates_multi` has to give the same periods as `group_dates` for every delta."""
+
+from utils.network import group_dates, group_dates_multi
+import datetime
+import random
+
+import pytest
+
+
+DELTAS = [0, 1, 3, 14, 31, 93, 186, 365, datetime.timedelta(days=2), datetime.timedelta(hours=36)]
+
+
+def get_dates(rng, count, span=800):
+    """Returns `count` random dates (as strings, unsorted, often with duplicates) within `span` days."""
+    start = datetime.date(1930, 1, 1)
+    pool = [start + datetime.timedelta(days=rng.randrange(span)) for _ in range(max(1, count // 2))]
+    return [rng.choice(pool).strftime("%Y-%m-%d") for _ in range(count)]
+
+
+def check(dates, deltas):
+    periods = group_dates_multi(dates, deltas=deltas)
+
+    assert list(periods) == list(deltas)
+    for delta in deltas:
+        assert periods[delta] == group_dates(dates, delta), delta
+
+
+def test_empty():
+    check([], DELTAS)
+    assert group_dates_multi([], deltas=[3]) == {3: []}
+
+
+def test_single_and_duplicate_dates():
+    check(["1935-03-29"], DELTAS)
+    check(["1935-03-29", "1935-03-29"], DELTAS)
+    check(["1935-03-29", "1935-03-30", "1935-03-29", "1935-03-30"], DELTAS)
+
+
+def test_docstring_example():
+    dates = ["1935-01-13", "1935-01-26", "1935-02-11", "1935-02-05", "1935-04-01", "1935-04-06"]
+    check(dates, [3, 14])
+    assert group_dates_multi(dates, deltas=[14])[14] == [
+        ["1935-01-13", "1935-01-26", "1935-02-05", "1935-02-11"],
+        ["1935-04-01", "1935-04-06"],
+    ]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_dates(seed):
+    rng = random.Random(seed)
+    dates = get_dates(rng, rng.randrange(1, 60), span=rng.choice([10, 100, 800, 4000]))
+    deltas = rng.sample(DELTAS, rng.randrange(1, len(DELTAS) + 1))
+
+    check(dates, deltas)
+
+
+def test_bad_date():
+    with pytest.raises(ValueError):
+        group_dates_multi(["1935-03-29", "1935-3"], deltas=[3])
@@ -0,0 +1,175 @@
+"""The incremental network mode (`incremental-networks`) has to give the same result as a full rebuild."""
+
+from utils.analytics import run_analytics
+from utils.network import (
+    build_networks,
+    get_changed_keys,
+    get_group_data,
+    get_group_data_checksums,
+    get_venue_checksums,
+    update_group_data,
+    update_networks,
+)
+from utils.pipeline import drop_unnamed
+import datetime
+import json
+import pandas as pd
+import random
+
+import pytest
+
+
+VARIANTS = {"": None, "-no-unnamed-performers": drop_unnamed}
+
+
+def get_frame(seed=1, rows=400, venues=12, clusters=4, performers=10):
+    """Returns a network frame (like `get_clean_network_data`) with random performances.
+
+    The venues fall into `clusters` groups with their own performers, so the networks have several components."""
+    rng = random.Random(seed)
+    start = datetime.date(1935, 1, 1)
+
+    records = []
+    for _ in range(rows):
+        venue = rng.randrange(venues)
+        cluster = venue % clusters
+        if rng.random() < 0.1:
+            performer = f"Unnamed performer ({venue})"
+        else:
+            performer = f"Performer {cluster}-{rng.randrange(performers)}"
+        records.append(
+            {
+                "Venue": f"Venue {venue}",
+                "Date": (start + datetime.timedelta(days=rng.randrange(700))).strftime("%Y-%m-%d"),
+                "Performer": performer,
+                "Revue": rng.choice(["", "Revue A", "Revue B", "Revue C"]),
+                "City": f"City {venue % 5}",
+            }
+        )
+
+    return pd.DataFrame(records)
+
+
+def edit_frame(df):
+    """Returns a copy of `df` with a few rows changed, one venue dropped and one venue added (all of them in the
+    clusters of venues 0 and 1, see `get_frame`)."""
+    df = df.copy()
+    rows = df.index[df["Venue"] == "Venue 0"]
+    df.loc[rows[0], "Performer"] = "Performer 0-0"
+    df.loc[rows[1], "Date"] = df.loc[rows[2], "Date"]
+    df.loc[rows[3], "Revue"] = "Revue D"
+    df = df[df["Venue"] != "Venue 5"]
+
+    added = df.iloc[:4].copy()
+    added["Venue"] = "Venue 99"
+    added["Performer"] = ["Performer 0-1", "Performer 0-2", "New performer", "Performer 0-1"]
+    added["Date"] = "1936-06-01"
+
+    return pd.concat([df, added], ignore_index=True)
+
+
+def categorical(df):
+    return df.astype({"Venue": "category", "Performer": "category", "Revue": "category", "City": "category"})
+
+
+def dump(G):
+    """Everything about `G` that ends up in the exported files, in order."""
+    return (
+        list(G.nodes(data=True)),
+        [(node, list(G.adj[node].items())) for node in G],
+        G.graph,
+    )
+
+
+@pytest.fixture(scope="module")
+def frames():
+    df = get_frame()
+    return categorical(df), categorical(edit_frame(df))
+
+
+@pytest.fixture(scope="module")
+def group_data(frames):
+    before, after = frames
+    previous = get_group_data(before)
+    venues = get_changed_keys(get_venue_checksums(before), get_venue_checksums(after))
+    return previous, update_group_data(previous, after, venues), get_group_data(after)
+
+
+@pytest.fixture(scope="module")
+def networks(group_data):
+    previous, updated, full = group_data
+    venues = get_changed_keys(get_group_data_checksums(previous), get_group_data_checksums(updated))
+    previous_networks = build_networks(previous, variants=VARIANTS)
+    return (
+        previous_networks,
+        update_networks(previous_networks, updated, venues, variants=VARIANTS),
+        build_networks(full, variants=VARIANTS),
+    )
+
+
+def test_venue_checksums(frames):
+    before, after = frames
+    changed = get_changed_keys(get_venue_checksums(before), get_venue_checksums(after))
+
+    assert "Venue 5" in changed and "Venue 99" in changed
+    assert len(changed) < before["Venue"].nunique()
+
+    # Row order does not matter
+    shuffled = before.sample(frac=1, random_state=1)
+    assert get_venue_checksums(shuffled) == get_venue_checksums(before)
+
+
+def test_update_group_data(group_data):
+    _, updated, full = group_data
+
+    assert json.dumps(updated) == json.dumps(full)
+
+
+def test_update_networks(networks):
+    _, updated, full = networks
+
+    assert list(updated) == list(full)
+    for key in full:
+        assert dump(updated[key]) == dump(full[key]), key
+
+
+def test_update_networks_without_changes(group_data):
+    previous, _, _ = group_data
+    networks = build_networks(previous, variants=VARIANTS)
+
+    updated = update_networks(networks, previous, set(), variants=VARIANTS)
+
+    for key in networks:
+        assert dump(updated[key]) == dump(networks[key]), key
+
+
+def test_run_analytics_with_previous(networks):
+    previous_networks, updated, full = networks
+
+    # Eigenvector centrality does not always converge on these small graphs (and is never reused anyway)
+    options = {"workers": 1, "seed": 7, "verbose": False}
+    options["centralities"] = {
+        key: {"eigenvector": {"mode": "skip"}} for key in full
+    }
+
+    previous = {}
+    run_analytics(previous_networks, state=previous, **options)
+
+    state = {}
+    results = run_analytics(updated, previous=previous, state=state, **options)
+    expected = run_analytics(full, **options)
+
+    # Some components were reused, and some were not
+    for metric in ["betweenness", "closeness"]:
+        reused = [
+            signature
+            for key in state
+            for signature in state[key][metric]
+            if signature in previous.get(key, {}).get(metric, {})
+        ]
+        assert 0 < len(reused) < sum(len(state[key][metric]) for key in state)
+
+    assert results == expected
+    for key in expected:
+        for metric in expected[key]:
+            assert list(results[key][metric]) == list(expected[key][metric]), (key, metric)
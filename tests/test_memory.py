@@ -0,0 +1,44 @@
+"""`track_peak_rss` measures the peak of the `with` block, not of the whole process."""
+
+from utils import track_peak_rss
+import builtins
+import os
+
+import numpy as np
+import pytest
+
+can_reset_peak = pytest.mark.skipif(
+    not os.access("/proc/self/clear_refs", os.W_OK), reason="needs a writable /proc/self/clear_refs (Linux)"
+)
+
+
+def allocate(mb):
+    a = np.ones(mb * 1024 * 1024, dtype=np.uint8)  # touches every page
+    return int(a[::4096].sum())
+
+
+@can_reset_peak
+def test_peak_of_block():
+    allocate(60)  # an earlier, larger peak of the process
+
+    with track_peak_rss() as memory:
+        allocate(20)
+
+    assert memory["before"] is not None and memory["after"] is not None
+    assert 15 <= memory["peak"] - memory["before"] < 50
+
+
+def test_peak_cannot_be_reset(monkeypatch):
+    def open_read_only(file, mode="r", *args, **kwargs):
+        if str(file) == "/proc/self/clear_refs":
+            raise PermissionError(13, "Permission denied", file)
+        return original_open(file, mode, *args, **kwargs)
+
+    original_open = builtins.open
+    monkeypatch.setattr(builtins, "open", open_read_only)
+
+    with track_peak_rss() as memory:
+        pass
+
+    assert memory["before"] is None and memory["after"] is None
+    assert memory["peak"] is None
@@ -0,0 +1,54 @@
+"""`save_json` writes DataFrames record by record, and has to give the same bytes as the round trip through
+`df.to_json` it replaced."""
+
+from utils import _dump_records, save_json
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def get_frame():
+    return pd.DataFrame(
+        {
+            "Performer": ["Jean Malin", "Zoë/Ñúñez", 'Bert "Savoy"', "back\\slash /", "", "李"],
+            "Source": ["Daily News, Jan 5, 1931", ("",), "a/b", ("",), "</script>", "Variety"],
+            "Year": [1931, 1932, 1933, 1934, 1935, 1936],
+            "lat": [40.7127753, np.nan, 1 / 3, 1e-7, 123456789.123456789, 0.0],
+            "Unsure": [True, False, True, False, True, False],
+        }
+    ).astype({"Performer": "category"})
+
+
+def get_expected(df):
+    return json.dumps(
+        json.loads(df.to_json(orient="records")), ensure_ascii=False, separators=(",", ":")
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 4, 6, 5000])
+def test_dump_records(chunk_size):
+    df = get_frame()
+    writer = io.StringIO()
+
+    _dump_records(df, writer, chunk_size=chunk_size)
+
+    assert writer.getvalue() == get_expected(df)
+
+
+def test_dump_empty_records():
+    writer = io.StringIO()
+
+    _dump_records(get_frame().iloc[:0], writer)
+
+    assert writer.getvalue() == "[]"
+
+
+def test_save_json_frame(tmp_path):
+    df = pd.concat([get_frame()] * 2000, ignore_index=True)
+
+    path = save_json(tmp_path / "full.json", df)
+
+    assert path.read_text(encoding="utf-8") == get_expected(df)
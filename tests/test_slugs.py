@@ -0,0 +1,80 @@
+"""The cached `slugify` and `slugify_edge` have to give the same slugs as the `slugify` they replaced (kept below as
+the reference), which is what the node and edge IDs in the published files are made of."""
+
+from utils import slugify, slugify_edge
+import random
+import re
+import unicodedata
+
+import pytest
+
+
+def reference_slugify(value):
+    value = str(value)
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    value = re.sub(r"[^\w\s-]", "", value.lower())
+    value = re.sub(r"^(\d+)", r"n\1", value)
+    value = re.sub(r"[-\s]+", "_", value).strip("-_")
+    return value
+
+
+VALUES = [
+    "Jean Malin",
+    "Karyl Norman",
+    "Francis Renault (The Last of the Red Hot Mamas)",
+    # Accents, combining marks and characters without an ASCII form
+    "Émile Lévesque",
+    "Ramón Novarro",
+    "Zoë Ñúñez",
+    "éè",
+    "Дмитрий",
+    "李",
+    # Ligatures and other compatibility characters
+    "Ŀœuvre ﬁne ﬂair",
+    "Æther Ǆ ½ ²",
+    # Leading digits
+    "42nd Street Revue",
+    "1935",
+    "007 Agent",
+    " 12 spaces first",
+    "-3 dash first",
+    # Runs of whitespace and dashes, and separators at the ends
+    "Gene   Dennis",
+    "Gene\t\nDennis",
+    "Gene - - Dennis",
+    "Gene--Dennis",
+    "_Gene_",
+    "-Gene-",
+    "  Gene  ",
+    "--",
+    "",
+    # Punctuation and forbidden characters
+    "Bert Savoy?",
+    "[Unnamed performer]",
+    "Mr. & Mrs. O'Brien",
+    "Rae Bourbon/Ray Bourbon",
+    123,
+    None,
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_slugify(value):
+    assert slugify(value) == reference_slugify(value)
+
+
+@pytest.mark.parametrize("source", VALUES)
+def test_slugify_edge(source):
+    for target in VALUES:
+        assert slugify_edge(source, target) == slugify(f"{source}-{target}")
+        assert slugify_edge(source, target) == reference_slugify(f"{source}-{target}")
+
+
+def test_random_strings():
+    rng = random.Random(1)
+    alphabet = "aZé9 -_\t.œﬁ½́Дß0"
+
+    values = ["".join(rng.choice(alphabet) for _ in range(rng.randrange(12))) for _ in range(2000)]
+    for source, target in zip(values, reversed(values)):
+        assert slugify(source) == reference_slugify(source)
+        assert slugify_edge(source, target) == reference_slugify(f"{source}-{target}")
@@ -0,0 +1,72 @@
+"""The source cache keeps snapshots of the sources by checksum."""
+
+from utils.sources import SourceCache
+import hashlib
+import os
+
+import pytest
+
+
+def test_store_local_file(tmp_path):
+    source = tmp_path / "sheet.csv"
+    source.write_text("a,b\n1,2\n")
+    cache = SourceCache(directory=tmp_path / "cache")
+
+    sha256 = cache.fetch(str(source))
+
+    assert sha256 == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert cache.path(str(source)).read_bytes() == source.read_bytes()
+    assert cache.read_csv(str(source)).to_dict("records") == [{"a": 1, "b": 2}]
+    assert [x.name for x in (tmp_path / "cache" / "blobs").iterdir()] == [sha256]
+
+
+def test_truncated_blob_is_replaced(tmp_path):
+    source = tmp_path / "sheet.csv"
+    source.write_text("a,b\n1,2\n")
+    sha256 = hashlib.sha256(source.read_bytes()).hexdigest()
+
+    blob = tmp_path / "cache" / "blobs" / sha256
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(source.read_bytes()[:3])
+
+    SourceCache(directory=tmp_path / "cache").fetch(str(source))
+
+    assert blob.read_bytes() == source.read_bytes()
+
+
+def test_interrupted_write_leaves_no_blob(tmp_path, monkeypatch):
+    source = tmp_path / "sheet.csv"
+    source.write_text("a,b\n1,2\n")
+    cache = SourceCache(directory=tmp_path / "cache")
+
+    class Interrupted(Exception):
+        pass
+
+    def replace(*args):
+        raise Interrupted()
+
+    # Interrupted just before the blob would be moved into place
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(Interrupted):
+        cache.fetch(str(source))
+    monkeypatch.undo()
+
+    assert list((tmp_path / "cache" / "blobs").iterdir()) == []
+    assert cache._snapshot(str(source)) is None
+
+
+def test_superseded_snapshots_are_removed(tmp_path):
+    source, other = tmp_path / "sheet.csv", tmp_path / "other.csv"
+    source.write_text("a,b\n1,2\n")
+    other.write_text("c\n3\n")
+    SourceCache(directory=tmp_path / "cache").fetch(str(source))
+    SourceCache(directory=tmp_path / "cache").fetch(str(other))
+    old = hashlib.sha256(source.read_bytes()).hexdigest()
+
+    source.write_text("a,b\n1,2\n3,4\n")
+    cache = SourceCache(directory=tmp_path / "cache")
+    sha256 = cache.fetch(str(source))
+
+    blobs = sorted(x.name for x in (tmp_path / "cache" / "blobs").iterdir())
+    assert not old in blobs
+    assert blobs == sorted([sha256, cache.fetch(str(other))])
@@ -0,0 +1,60 @@
+"""The pipeline runs stages only when their output is out of date."""
+
+from utils.stages import Pipeline, Stage, StageStore
+
+
+def get_pipeline(tmp_path, calls, force=[]):
+    def source(pipeline):
+        calls.append("source")
+        return {"values": [1, 2, 3]}
+
+    def total(pipeline, data):
+        calls.append("total")
+        return sum(data["values"])
+
+    def double(pipeline, data):
+        calls.append("double")
+        data["values"] = [x * 2 for x in data["values"]]
+        return data
+
+    stages = [
+        Stage("source", source),
+        Stage("double", double, inputs=["source"], cache=False, mutates=True),
+        Stage("total", total, inputs=["source"]),
+    ]
+    return Pipeline(stages, {}, StageStore(tmp_path / "stages"), force=force)
+
+
+def test_reuses_outputs(tmp_path):
+    calls = []
+    assert get_pipeline(tmp_path, calls).run(["total"]) == {"total": 6}
+    assert calls == ["source", "total"]
+
+    calls = []
+    pipeline = get_pipeline(tmp_path, calls)
+    assert pipeline.run(["total"]) == {"total": 6}
+    assert calls == []
+    assert pipeline.reused == ["total"]
+
+
+def test_mutated_inputs_are_loaded_again(tmp_path):
+    calls = []
+    pipeline = get_pipeline(tmp_path, calls)
+
+    # `double` changes the output of `source` in place, so `total` gets it from the store
+    assert pipeline.run(["double", "total"]) == {
+        "double": {"values": [2, 4, 6]},
+        "total": 6,
+    }
+    assert calls == ["source", "double", "total"]
+
+
+def test_forced_stage_runs_once(tmp_path):
+    get_pipeline(tmp_path, []).run(["total"])
+
+    calls = []
+    pipeline = get_pipeline(tmp_path, calls, force=["source"])
+    assert pipeline.run(["double", "total"])["total"] == 6
+    assert calls == ["source", "double", "total"]
+    assert pipeline.ran == ["source", "double", "total"]
+    assert pipeline.reused == []
@@ -1,25 +1,20 @@
 from pathlib import Path
+import contextlib
+import functools
+import hashlib
 import json
+import os
+import re
+import stat
+import tempfile
+import time
+import unicodedata
 import yaml
 import datetime
 
 
 debug = False
 
-replace_scheme = (
-    {  # Replacement strings for utf-encoded data (To be fixed in future versions)
-        "\\u2014": "",
-        "\\u2019": "'",
-        "\\u00a0": " ",
-        "\\u2013": "–",
-        "\\u00e9": "é",
-        "\\u201c": "“",
-        "\\u201d": "”",
-        "\\u00bd": "½",
-        "\\u2014": "—",
-    }
-)
-
 
 def log(msg="", *args, **kwargs):
     if kwargs.get("verbose") == False:
@@ -32,45 +27,383 @@ def log(msg="", *args, **kwargs):
         print()
 
 
-# Load settings
+# Slugs (used for node and edge IDs)
 
-with open("settings.yml", "r") as stream:
-    try:
-        settings = yaml.safe_load(stream)
-        full_dataset_file = Path(
-            settings["data-directory"] + "/" + settings["full-dataset"]
-        )
-        skip_data = settings["skip-columns"]
-        pairings = [(x[0], x[1]) for x in settings["pairings"]]
+SLUG_DISALLOWED = re.compile(r"[^\w\s-]")
+SLUG_LEADING_NUMBER = re.compile(r"^(\d+)")
+SLUG_SEPARATORS = re.compile(r"[-\s]+")
 
-        settings["pairings-directory"] = Path(
-            settings["data-directory"] + "/" + settings["pairings-directory"] + "/"
+
+@functools.lru_cache(maxsize=65536, typed=True)
+def get_slug_base(value, allow_unicode=False):
+    """Returns `value` normalized, lowercased and without the characters that are not allowed in a slug.
+
+    These steps work character by character, so the base of `f"{a}-{b}"` is the base of `a` + "-" + the base of `b`."""
+    value = str(value)
+    if allow_unicode:
+        value = unicodedata.normalize("NFKC", value)
+    else:
+        value = (
+            unicodedata.normalize("NFKD", value)
+            .encode("ascii", "ignore")
+            .decode("ascii")
         )
-        settings["values-directory"] = Path(
-            settings["data-directory"] + "/" + settings["values-directory"] + "/"
+    return SLUG_DISALLOWED.sub("", value.lower())
+
+
+def finish_slug(base):
+    """Turns a slug base (see `get_slug_base`) into a slug: prefixes a leading number with `n` and joins the words with `_`."""
+    base = SLUG_LEADING_NUMBER.sub(r"n\1", base)
+    return SLUG_SEPARATORS.sub("_", base).strip("-_")
+
+
+@functools.lru_cache(maxsize=65536, typed=True)
+def slugify(value, allow_unicode=False, verbose=False):
+    slug = finish_slug(get_slug_base(value, allow_unicode=allow_unicode))
+    log(f"Making slug from {value}: {slug}", verbose=verbose or debug)
+    return slug
+
+
+@functools.lru_cache(maxsize=65536, typed=True)
+def slugify_edge(source, target, allow_unicode=False, verbose=False):
+    """Returns the same slug as `slugify(f"{source}-{target}")`, built from the (cached) slug bases of the two nodes."""
+    slug = finish_slug(
+        get_slug_base(source, allow_unicode=allow_unicode)
+        + "-"
+        + get_slug_base(target, allow_unicode=allow_unicode)
+    )
+    log(f"Making slug from {source}-{target}: {slug}", verbose=verbose or debug)
+    return slug
+
+
+# Settings (loaded by `load_settings`, which the entry points call before anything else)
+
+settings = {}
+
+
+def load_settings(path="settings.yml", data_directory=None):
+    """Loads the settings from the YAML file at `path` into `settings` and returns them.
+
+    `settings` is updated in place, so the modules that imported it see the new values. If `data_directory` is set, it
+    replaces `data-directory`, under which all the output files are written."""
+    global _manifest
+
+    with open(path, "r") as stream:
+        try:
+            loaded = yaml.safe_load(stream)
+        except yaml.YAMLError as e:
+            raise RuntimeError(e)
+
+    if data_directory is not None:
+        loaded["data-directory"] = str(data_directory)
+
+    loaded["pairings-directory"] = Path(loaded["data-directory"]) / loaded["pairings-directory"]
+    loaded["values-directory"] = Path(loaded["data-directory"]) / loaded["values-directory"]
+
+    loaded["save-unnamed-networks"] = False
+
+    settings.clear()
+    settings.update(loaded)
+
+    # The manifest lives in the data directory, which may have changed
+    _manifest = None
+
+    if debug:
+        log("######## Settings loaded: ################", padding_y=True)
+        for key in settings:
+            if type(settings[key]) == list:
+                log(f"{key}:")
+                [log(f"- {x}") for x in settings[key]]
+                log()
+            else:
+                log(f"{key}: {settings[key]}", padding_bottom=True)
+        log("#########################################", padding_y=True)
+
+    return settings
+
+
+# The process' umask, for the permissions of new files (read once, as it can only be read by setting it)
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode="w", encoding="utf-8", keep=None):
+    """Opens a temporary file in the same directory as `path` for writing, and moves it into place once the `with`
+    block is done, so that readers never see a half-written file. If the block raises, `path` is left untouched. The
+    file keeps the permissions of the file it replaces (new files get the usual `0o666` less the umask, rather than the
+    temporary file's `0o600`).
+
+    If `keep` is set, it is called once the block is done, and the temporary file is thrown away (leaving `path` as it
+    was) unless it returns `True`."""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as f:
+            yield f
+        if keep is None or keep():
+            try:
+                permissions = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                permissions = 0o666 & ~_umask
+            os.chmod(tmp, permissions)
+            os.replace(tmp, path)
+        else:
+            os.unlink(tmp)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def atomic_write_text(path, text, encoding="utf-8"):
+    """Writes `text` to `path` through a temporary file in the same directory, so that readers never see a half-written file."""
+    with atomic_open(path, encoding=encoding) as f:
+        f.write(text)
+
+    return Path(path)
+
+
+# The types of the values in the object columns that `save_frame` stores in Arrow string columns, and the code it
+# stores for each value's type in a separate `<column>:kind` column (so that `load_frame` can bring them back)
+FRAME_VALUE_KINDS = {str: 0, bool: 1, tuple: 2}
+FRAME_KIND_SUFFIX = ":kind"
+
+
+def _encode_frame(df):
+    """(internal) returns `df` with the object columns that mix strings with booleans and/or one-string tuples (like
+    the cleaned `Source` and the `Unsure whether drag artist` flag) stored as strings plus a column with the type code
+    of every value (see `FRAME_VALUE_KINDS`), or `df` itself if no column needs it. Other columns are left as they are."""
+    import numpy as np
+
+    encoded = {}
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+
+        values = df[col].to_numpy()
+        kinds = np.array([FRAME_VALUE_KINDS.get(type(v), -1) for v in values], dtype=np.int8)
+        if not (kinds > 0).any():
+            continue
+        if (kinds < 0).any() or any(len(v) != 1 or type(v[0]) != str for v in values[kinds == 2]):
+            continue  # left for Arrow to reject
+
+        strings = values.copy()
+        strings[kinds == 1] = [str(v) for v in values[kinds == 1]]
+        strings[kinds == 2] = [v[0] for v in values[kinds == 2]]
+        encoded[col] = strings
+        encoded[f"{col}{FRAME_KIND_SUFFIX}"] = kinds
+
+    if not encoded:
+        return df
+
+    return df.assign(**encoded)
+
+
+def _decode_frame(df):
+    """(internal) undoes `_encode_frame`"""
+    kind_columns = [col for col in df.columns if col.endswith(FRAME_KIND_SUFFIX)]
+
+    for kind_column in kind_columns:
+        col = kind_column[: -len(FRAME_KIND_SUFFIX)]
+        values = df[col].to_numpy(dtype=object)
+        kinds = df[kind_column].to_numpy()
+
+        values[kinds == 1] = [v == "True" for v in values[kinds == 1]]
+        for ix in (kinds == 2).nonzero()[0]:
+            values[ix] = (values[ix],)
+        df[col] = values
+
+    return df.drop(columns=kind_columns)
+
+
+def save_frame(df, path):
+    """Saves `df` (which needs a default index) as a Feather file if `pyarrow` is available, and as a pickle otherwise.
+
+    Object columns that mix strings with booleans or one-string tuples are encoded to fit in Arrow columns (and decoded
+    by `load_frame`). Returns the path of the file written, which has the extension of the format used."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        _encode_frame(df).to_feather(tmp)
+        path = path.with_suffix(".feather")
+    except (ImportError, TypeError, ValueError) as e:
+        # `pyarrow` is missing or the frame holds values that do not fit in an Arrow column
+        log(f"Could not save {path} as Feather ({e}), saving as pickle.", verbose=debug)
+        df.to_pickle(tmp)
+        path = path.with_suffix(".pickle")
+
+    os.replace(tmp, path)
+    return path
+
+
+def load_frame(path):
+    """Loads a DataFrame saved by `save_frame` (or returns `None` if there is none at `path`)."""
+    path = Path(path)
+
+    if path.with_suffix(".feather").exists():
+        import pandas as pd
+
+        return _decode_frame(pd.read_feather(path.with_suffix(".feather")))
+
+    if path.with_suffix(".pickle").exists():
+        import pandas as pd
+
+        return pd.read_pickle(path.with_suffix(".pickle"))
+
+    return None
+
+
+# Output manifest (content hashes of the files written by `save_json`)
+
+
+class Manifest:
+    """The SHA-256 checksum and size of every output file, kept in a JSON file (`data/manifest.json` by default).
+
+    Used by `save_json` to tell whether a file's new content is any different from what is already on disk."""
+
+    def __init__(self, path="data/manifest.json"):
+        self.path = Path(path)
+
+        if self.path.exists():
+            self.files = json.loads(self.path.read_text())
+        else:
+            self.files = {}
+
+    def is_unchanged(self, path, sha256, size):
+        """Returns `True` if `path` exists and was last written with the content `sha256` (of `size` bytes)."""
+        entry = self.files.get(Path(path).as_posix())
+        return (
+            entry is not None
+            and entry["sha256"] == sha256
+            and entry["bytes"] == size
+            and Path(path).exists()
+            and Path(path).stat().st_size == size
         )
 
-        settings["save-unnamed-networks"] = False
-    except yaml.YAMLError as e:
-        raise RuntimeError(e)
-
-if debug:
-    log("######## Settings loaded: ################", padding_y=True)
-for key in settings:
-    if type(settings[key]) == list:
-        if debug:
-            log(f"{key}:")
-            [log(f"- {x}") for x in settings[key]]
-            log()
-    else:
-        if debug:
-            log(f"{key}: {settings[key]}", padding_bottom=True)
-if debug:
-    log("#########################################", padding_y=True)
+    def set(self, path, sha256, size):
+        self.files[Path(path).as_posix()] = {"sha256": sha256, "bytes": size}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self.path, json.dumps(self.files, sort_keys=True, indent=2))
+        return self.path
+
+
+_manifest = None
+
+
+def get_manifest():
+    """Returns the output manifest, `data/manifest.json` (read on first use)."""
+    global _manifest
+
+    if _manifest is None:
+        _manifest = Manifest(Path(settings.get("data-directory", "data")) / "manifest.json")
+
+    return _manifest
+
+
+class _HashingWriter:
+    """(internal) encodes everything written to it as UTF-8 and passes it on to a binary file, while keeping track of its checksum and size"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+
+def _dump_records(df, writer, chunk_size=5000):
+    """(internal) writes the records of `df` to `writer` as a JSON array, `chunk_size` rows at a time. Each chunk goes
+    through `df.to_json` (and is parsed again), so the values come out exactly like those of
+    `json.loads(df.to_json(orient="records"))`, but neither the whole frame's JSON nor all its records are held at once"""
+    writer.write("[")
+    for start in range(0, len(df), chunk_size):
+        records = json.loads(df.iloc[start : start + chunk_size].to_json(orient="records"))
+        if start:
+            writer.write(",")
+        writer.write(json.dumps(records, ensure_ascii=False, separators=(",", ":"))[1:-1])
+    writer.write("]")
+
+
+# The size (in bytes), time to write (in seconds) and whether it changed, of every file written by `save_json`, by
+# absolute path
+write_stats = {}
+
+# The files whose content changed in this run (as paths relative to the working directory)
+changed_files = []
+
+_result_directories = set()
+
+
+def save_json(path, result, pretty=False):
+    """Writes `result` to `path` as JSON and returns the path.
+
+    `result` is serialized once, straight to the file (through `atomic_open`), with non-ASCII characters written as
+    they are. A `result` that is already a JSON string is parsed first, and a DataFrame is written as its records, in
+    chunks (see `_dump_records`). If the output's checksum matches the one in the
+    manifest (see `get_manifest`), the file on disk is left as it is; otherwise it is replaced and added to
+    `changed_files`. The file's size, the time it took and whether it changed are kept in `write_stats`."""
+
+    start = time.perf_counter()
+
+    if type(result) == str:
+        result = json.loads(result)
+
+    is_frame = hasattr(result, "to_json")
+    if is_frame and pretty:
+        result, is_frame = json.loads(result.to_json(orient="records")), False
+
+    path = Path(path)
+    if not path.parent in _result_directories:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _result_directories.add(path.parent)
+
+    manifest = get_manifest()
+    writer, changed = None, None
+
+    def keep():
+        nonlocal changed
+        changed = not manifest.is_unchanged(path, writer.sha256.hexdigest(), writer.size)
+        return changed
+
+    with atomic_open(path, "wb", keep=keep) as f:
+        writer = _HashingWriter(f)
+        if is_frame:
+            _dump_records(result, writer)
+        elif pretty:
+            json.dump(result, writer, ensure_ascii=False, sort_keys=True, indent=2)
+        else:
+            json.dump(result, writer, ensure_ascii=False, separators=(",", ":"))
+
+    if changed:
+        manifest.set(path, writer.sha256.hexdigest(), writer.size)
+        if not path.as_posix() in changed_files:
+            changed_files.append(path.as_posix())
+
+    stats = {
+        "bytes": writer.size,
+        "seconds": round(time.perf_counter() - start, 3),
+        "changed": changed,
+    }
+    write_stats[str(path.absolute())] = stats
+    log(
+        f"{'Wrote' if changed else 'Skipped (unchanged)'} {path} ({stats['bytes']} bytes in {stats['seconds']}s)",
+        verbose=debug,
+    )
+
+    return path
 
 
 def save_result(cat, result, kind, pretty=False):
-    '''kind = "values" / "pairing"'''
+    """Writes `result` to `{data-directory}/{kind}/{cat}.json` (see `save_json`) and returns the path (`kind` is
+    "values", "pairings", "network", etc.)."""
 
     def fix_cat(cat):
         cat = cat.lower()
@@ -78,51 +411,68 @@ def save_result(cat, result, kind, pretty=False):
             cat = cat.replace(search, replace)
         return cat
 
-    cat = fix_cat(cat)
+    return save_json(
+        Path(settings.get("data-directory", "data")) / kind / f"{fix_cat(cat)}.json",
+        result,
+        pretty=pretty,
+    )
 
-    if type(result) == dict:
-        json_str = json.dumps(result)
-    else:
-        json_str = result
 
-    _data = json.loads(json_str)
-    if pretty:
-        json_str = json.dumps(_data, sort_keys=True, indent=2)
-    else:
-        json_str = json.dumps(_data, separators=(",", ":"))
-
-    # Replace wonky characters (TODO: Fix this more elegantly)
-    for search, replace in replace_scheme.items():
-        json_str = json_str.replace(search, replace)
-
-    prohibited = json_str.find("\\u")
-    if prohibited > 0:
-        print("Warning:", prohibited)
-        print(json_str[prohibited - 30 : prohibited + 30])
-
-    # print(f'writing {cat}')
+def get_peak_rss():
+    """Returns the peak resident set size (memory use) of the current process in MB, or `None` where it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
 
-    if not Path(f"data/{kind}/{cat}.json").parent.exists():
-        Path(f"data/{kind}/{cat}.json").parent.mkdir(parents=True)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if os.uname().sysname == "Darwin":
+        return round(peak / 1024 / 1024, 1)  # bytes on macOS
 
-    Path(f"data/{kind}/{cat}.json").write_text(json_str)
+    return round(peak / 1024, 1)  # kilobytes on Linux
 
-    return Path(f"data/{kind}/{cat}.json")
 
+def _read_memory_status():
+    """(internal) returns the current (`VmRSS`) and peak (`VmHWM`) resident set size of the process in MB, from `/proc` (so on Linux only)"""
+    status = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ["VmRSS", "VmHWM"]:
+                status[key] = round(int(value.split()[0]) / 1024, 1)
 
-# Ensure main directories exist
+    return status["VmRSS"], status["VmHWM"]
 
-if not full_dataset_file.parent.exists():
-    full_dataset_file.parent.mkdir(parents=True)
 
-if not settings["values-directory"].exists():
-    settings["values-directory"].mkdir(parents=True)
+@contextlib.contextmanager
+def track_peak_rss():
+    """Measures the memory use of the `with` block. Yields a dictionary that holds, once the block is done, the resident
+    set size (in MB) before (`before`) and after it (`after`) and its peak during the block (`peak`).
 
-if not settings["pairings-directory"].exists():
-    settings["pairings-directory"].mkdir(parents=True)
+    On Linux, the kernel's record of the peak is reset when the block starts, so `peak` is the block's own peak (and
+    `get_peak_rss` reports the peak since then). Elsewhere, only the peak of the whole process is known: `peak` is set
+    if the block raised it, and is `None` otherwise. `before` and `after` are only known where the peak can be reset
+    (they are either both set or both `None`)."""
+    memory = {"before": None, "after": None, "peak": None}
 
-if not Path("data/network").exists():
-    Path("data/network").mkdir(parents=True)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # resets the peak
+        memory["before"], _ = _read_memory_status()
+        reset = True
+    except (OSError, KeyError, ValueError):
+        # No `/proc`, or it is read-only (as in some containers)
+        reset = False
+        previous_peak = get_peak_rss()
+
+    yield memory
+
+    if reset:
+        memory["after"], memory["peak"] = _read_memory_status()
+    else:
+        peak = get_peak_rss()
+        if peak is not None and previous_peak is not None and peak > previous_peak:
+            memory["peak"] = peak
 
 
 class Timer:
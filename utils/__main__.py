@@ -0,0 +1,60 @@
+"""Runs the pipeline (see `utils/pipeline.py`), or part of it, from the command line:
+
+    python -m utils values --out /tmp/data
+
+Only the settings are loaded up front; the data libraries are imported once a command runs, and only the ones its
+stages need."""
+
+from . import load_settings
+from .stages import add_force_argument
+import argparse
+
+
+COMMAND_HELP = {
+    "fetch": "fetch the main dataset and write the full dataset",
+    "values": "write the values files",
+    "pairings": "write the pairings files",
+    "network": "write the network data, the group data and the live co-occurrence networks",
+    "ego": "write the ego networks",
+    "all": "write everything (like `sync-data.py`)",
+}
+
+
+def get_parser():
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument(
+        "--config",
+        default="settings.yml",
+        metavar="FILE",
+        help="the settings file to use (default: settings.yml)",
+    )
+    options.add_argument(
+        "--out",
+        default=None,
+        metavar="DIR",
+        help="write the output files to DIR instead of the `data-directory` in the settings",
+    )
+    add_force_argument(options)
+
+    parser = argparse.ArgumentParser(
+        prog="python -m utils", description="Synchronize the drag dataset, or parts of it."
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+    for command, help in COMMAND_HELP.items():
+        commands.add_parser(command, parents=[options], help=help, description=help)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    settings = load_settings(args.config, data_directory=args.out)
+
+    from .pipeline import COMMANDS, run_targets
+
+    run_targets(settings, COMMANDS[args.command], force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+from . import log
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import community as community_louvain
+import networkx as nx
+import hashlib
+import json
+import random
+
+
+# The community detection algorithms and centralities generated for every network, in the order they are added
+COMMUNITIES = {"louvain": "Louvain", "clauset-newman-moore": "Clauset-Newman-Moore"}
+CENTRALITIES = {
+    "degree": "degree_centrality_100x",
+    "betweenness": "betweenness_centrality_100x",
+    "eigenvector": "eigenvector_centrality_100x",
+    "closeness": "closeness_centrality_100x",
+}
+METRICS = [*COMMUNITIES, *CENTRALITIES]
+
+# The modes each centrality can be computed in (see `get_centrality_modes`)
+CENTRALITY_MODES = {
+    "degree": ["exact", "skip"],
+    "betweenness": ["exact", "sampled", "skip"],
+    "eigenvector": ["exact", "skip"],
+    "closeness": ["exact", "sampled", "skip"],
+}
+
+# Metrics in (rough) order of cost, so that the slowest jobs are started first
+COSTS = {
+    "betweenness": 5,
+    "closeness": 4,
+    "clauset-newman-moore": 3,
+    "louvain": 2,
+    "eigenvector": 1,
+    "degree": 0,
+}
+
+
+def get_structure(G):
+    """Returns a copy of `G` with its nodes and edges only, which is cheap to send to another process."""
+    H = nx.Graph()
+    H.add_nodes_from(G)
+    H.add_edges_from(G.edges())
+    return H
+
+
+def get_centrality_modes(key, settings={}):
+    """Returns the mode (and parameters) to compute each centrality in for the network `key`.
+
+    `settings` is the `analytics` section of `settings.yml`: its `centralities` set the defaults and its `networks` can
+    override them per network. Each centrality is `{"mode": "exact"}`, `{"mode": "skip"}` or `{"mode": "sampled", "k": ...,
+    "seed": ...}`, where `k` is the number of pivots to sample (the seed defaults to `0` so that sampled runs are repeatable).
+    """
+    modes = {}
+    for metric in CENTRALITIES:
+        mode = {"mode": "exact"}
+        mode.update((settings.get("centralities") or {}).get(metric) or {})
+        mode.update(((settings.get("networks") or {}).get(key) or {}).get(metric) or {})
+
+        if not mode["mode"] in CENTRALITY_MODES[metric]:
+            raise RuntimeError(
+                f"{metric} centrality cannot be computed in mode `{mode['mode']}` (network {key}). Use one of: {', '.join(CENTRALITY_MODES[metric])}."
+            )
+
+        if mode["mode"] == "sampled":
+            if not mode.get("k"):
+                raise RuntimeError(
+                    f"Sampled {metric} centrality needs a number of pivots, `k` (network {key})."
+                )
+            mode = {"mode": "sampled", "k": int(mode["k"]), "seed": mode.get("seed") or 0}
+        else:
+            mode = {"mode": mode["mode"]}
+
+        modes[metric] = mode
+
+    return modes
+
+
+def sampled_closeness_centrality(G, k, seed=0, min_pivots=10):
+    """Estimates the closeness centrality of every node in `G` from breadth-first searches from `k` sampled pivots.
+
+    Pivots are spread over the connected components in proportion to their size, with at least `min_pivots` per
+    component. A node's total distance to the rest of its component is estimated from its distance to the component's
+    pivots (Eppstein and Wang's estimator) and then used like in `nx.closeness_centrality` (with `wf_improved`). The
+    pivots' own values are exact, and so are the values of components where every node ends up a pivot (i.e. those with
+    at most `min_pivots` nodes, and all of them if `k` is at least the number of nodes).
+    """
+
+    rng = random.Random(seed)
+    n = len(G)
+
+    closeness = {}
+    for component in nx.connected_components(G):
+        component = sorted(component)
+        size = len(component)
+
+        if size == 1:
+            closeness[component[0]] = 0.0
+            continue
+
+        pivot_count = min(size, max(min_pivots, round(k * size / n)))
+        pivots = rng.sample(component, pivot_count)
+
+        distances = dict.fromkeys(component, 0)
+        exact = {}
+        for pivot in pivots:
+            path_lengths = nx.single_source_shortest_path_length(G, pivot)
+            exact[pivot] = sum(path_lengths.values())
+            for node, length in path_lengths.items():
+                distances[node] += length
+
+        for node in component:
+            if node in exact:
+                total = exact[node]
+            else:
+                total = distances[node] * (size - 1) / pivot_count
+
+            closeness[node] = ((size - 1) / total) * ((size - 1) / (n - 1)) if total else 0.0
+
+    return closeness
+
+
+def run_metric(G, metric, seed=None, mode={"mode": "exact"}):
+    """Returns a dictionary of each node in `G` and its value for `metric` (see `METRICS`).
+
+    For the centralities, `mode` is one of the modes returned by `get_centrality_modes`."""
+    if metric == "louvain":
+        return community_louvain.best_partition(G, random_state=seed)
+
+    if metric == "clauset-newman-moore":
+        return {
+            performer: community_number
+            for community_number, list_of_performers in enumerate(
+                nx.community.greedy_modularity_communities(G), start=1
+            )
+            for performer in list_of_performers
+        }
+
+    if metric == "degree":
+        return nx.degree_centrality(G)
+
+    if metric == "betweenness" and mode["mode"] == "sampled":
+        return nx.betweenness_centrality(G, k=min(mode["k"], len(G)), seed=mode["seed"])
+
+    if metric == "betweenness":
+        return nx.betweenness_centrality(G)
+
+    if metric == "eigenvector":
+        return nx.eigenvector_centrality(G, max_iter=1000, weight="weight")
+
+    if metric == "closeness" and mode["mode"] == "sampled":
+        return sampled_closeness_centrality(G, mode["k"], seed=mode["seed"])
+
+    if metric == "closeness":
+        return nx.closeness_centrality(G)
+
+    raise RuntimeError(f"Unknown metric: {metric}")
+
+
+# The centralities whose exact values can be kept per connected component (see `run_analytics`)
+COMPONENT_CENTRALITIES = ["betweenness", "closeness"]
+
+
+def get_component_signatures(G):
+    """Returns the connected components of `G` (as lists of nodes, in the order of `G.nodes`) by a checksum of their
+    nodes and edges, in order. Two components with the same signature get the same (raw) centralities."""
+    component_ids = {}
+    for component_id, component in enumerate(nx.connected_components(G)):
+        component_ids.update(dict.fromkeys(component, component_id))
+
+    components = {}
+    for node in G:
+        components.setdefault(component_ids[node], []).append(node)
+
+    return {
+        hashlib.sha256(
+            json.dumps([[node, list(G.adj[node])] for node in component]).encode("utf-8")
+        ).hexdigest(): component
+        for component in components.values()
+    }
+
+
+def get_raw_centrality(G, metric, nodes):
+    """Returns the exact `metric` (one of `COMPONENT_CENTRALITIES`) of the nodes in `nodes`, a union of connected
+    components of `G`, before it is scaled to the size of `G` (see `scale_centrality`)."""
+    if len(nodes) < len(G):
+        # A copy with the nodes and each node's neighbors in the same order as in `G` (which the sums of the shortest
+        # paths are added up in, so the values come out the same to the last bit), and a lot faster than a subgraph view
+        H = nx.Graph()
+        H.add_nodes_from(node for node in G if node in nodes)
+        for node in H:
+            H._adj[node].update(G._adj[node])
+    else:
+        H = G
+
+    if metric == "betweenness":
+        return nx.betweenness_centrality(H, normalized=False)
+
+    if metric == "closeness":
+        raw = {}
+        for node in H:
+            path_lengths = nx.single_source_shortest_path_length(H, node)
+            raw[node] = (len(path_lengths), sum(path_lengths.values()))
+        return raw
+
+    raise RuntimeError(f"Unknown component metric: {metric}")
+
+
+def scale_centrality(metric, raw, n):
+    """Returns the values of `nx.betweenness_centrality` or `nx.closeness_centrality` for a graph with `n` nodes from
+    the raw values of `get_raw_centrality`."""
+    if metric == "betweenness":
+        scale = 1 / ((n - 1) * (n - 2)) if n > 2 else None
+
+        values = {}
+        for node, value in raw.items():
+            value *= 2  # undoes `normalized=False`
+            if scale is not None:
+                value *= scale
+            values[node] = value
+        return values
+
+    if metric == "closeness":
+        values = {}
+        for node, (reach, total) in raw.items():
+            value = 0.0
+            if total > 0.0 and n > 1:
+                value = (reach - 1.0) / total
+                value *= (reach - 1.0) / (n - 1)
+            values[node] = value
+        return values
+
+    raise RuntimeError(f"Unknown component metric: {metric}")
+
+
+_structures = {}
+
+
+def _set_structures(structures):
+    """(internal) sets up the networks in a worker process, so that they are only sent over once per worker"""
+    global _structures
+    _structures = structures
+
+
+def _run_job(key, metric, seed, mode, nodes=None):
+    """(internal) runs one metric on one of the networks set up in the worker process (for `nodes` only, if set, see `get_raw_centrality`)"""
+    if nodes is not None:
+        return get_raw_centrality(_structures[key], metric, nodes)
+    return run_metric(_structures[key], metric, seed=seed, mode=mode)
+
+
+def run_analytics(
+    networks, workers=None, seed=None, centralities={}, verbose=True, previous=None, state=None
+):
+    """Runs every metric in `METRICS` on every network in `networks` and returns the results as `{key: {metric: values}}`.
+
+    `centralities` can hold each network's centrality modes (see `get_centrality_modes`); centralities in mode `skip` are
+    left out of the results, and any network not in `centralities` gets exact centralities.
+
+    Each (network, metric) job is run in a `ProcessPoolExecutor` with `workers` processes (all cores if `None`). With
+    `workers=1`, the jobs are run one by one in the current process instead. Both give the same results when `seed` is set.
+
+    If `state` is a dictionary, the raw values of the exact `COMPONENT_CENTRALITIES` are kept in it for every connected
+    component (by network, metric and the component's signature, see `get_component_signatures`). The values in
+    `previous`, the `state` of an earlier run, are reused for the components that have not changed since, and only the
+    other components are computed. The community algorithms and other centralities always run on the whole network.
+    """
+
+    structures = {key: get_structure(G) for key, G in networks.items()}
+
+    def get_mode(key, metric):
+        return centralities.get(key, {}).get(metric, {"mode": "exact"})
+
+    jobs = sorted(
+        [
+            (key, metric)
+            for key in networks
+            for metric in METRICS
+            if get_mode(key, metric)["mode"] != "skip"
+        ],
+        key=lambda job: (-structures[job[0]].number_of_edges(), -COSTS[job[1]]),
+    )
+    results = {key: {} for key in networks}
+
+    # The components that need their (raw) values computed, by job, and the raw values that can be reused
+    dirty, reused, raw_results = {}, {}, {}
+    if state is not None:
+        signatures = {key: get_component_signatures(G) for key, G in structures.items()}
+        for key, metric in jobs:
+            if not metric in COMPONENT_CENTRALITIES or get_mode(key, metric)["mode"] != "exact":
+                continue
+
+            old = ((previous or {}).get(key) or {}).get(metric) or {}
+            reused[(key, metric)] = {
+                signature: old[signature] for signature in signatures[key] if signature in old
+            }
+            dirty[(key, metric)] = {
+                node
+                for signature, component in signatures[key].items()
+                if not signature in old
+                for node in component
+            }
+            raw_results[(key, metric)] = {}
+
+        log(
+            f"    Reusing {sum(len(x) for x in reused.values())} components' centralities, computing {sum(len(x) for x in dirty.values())} nodes' centralities.",
+            verbose=verbose,
+        )
+
+        jobs = [job for job in jobs if not job in dirty or dirty[job]]
+
+    def set_result(key, metric, result):
+        if (key, metric) in raw_results:
+            raw_results[(key, metric)] = result
+        else:
+            results[key][metric] = result
+
+    if workers == 1:
+        for key, metric in jobs:
+            log(f"    {key}: {metric}...", verbose=verbose)
+            if (key, metric) in dirty:
+                result = get_raw_centrality(structures[key], metric, dirty[(key, metric)])
+            else:
+                result = run_metric(structures[key], metric, seed=seed, mode=get_mode(key, metric))
+            set_result(key, metric, result)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_set_structures, initargs=(structures,)
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _run_job, key, metric, seed, get_mode(key, metric), dirty.get((key, metric))
+                ): (key, metric)
+                for key, metric in jobs
+            }
+            for future in as_completed(futures):
+                key, metric = futures[future]
+                set_result(key, metric, future.result())
+                log(f"    {key}: {metric} done.", verbose=verbose)
+
+    for (key, metric), raw in raw_results.items():
+        components = {
+            signature: reused[(key, metric)].get(signature)
+            or {node: raw[node] for node in component}
+            for signature, component in signatures[key].items()
+        }
+        state.setdefault(key, {})[metric] = components
+
+        merged = {}
+        for values in components.values():
+            merged.update(values)
+        results[key][metric] = scale_centrality(
+            metric, {node: merged[node] for node in structures[key]}, len(structures[key])
+        )
+
+    return results
+
+
+def add_analytics(G, results):
+    """Adds the results of `run_analytics` for `G` to its nodes' `modularities` and `centralities` attributes."""
+    for performer in G.nodes:
+        G.nodes[performer]["modularities"] = {
+            name: results[metric][performer]
+            for metric, name in COMMUNITIES.items()
+            if performer in results.get(metric, {})
+        }
+        G.nodes[performer]["centralities"] = {
+            name: round(results[metric][performer] * 100, 6)
+            for metric, name in CENTRALITIES.items()
+            if performer in results.get(metric, {})
+        }
+
+    return G
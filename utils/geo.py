@@ -0,0 +1,287 @@
+from . import log, debug, atomic_write_text
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import datetime
+import hashlib
+import json
+import threading
+import time
+
+
+GEO_FIELDS = ["lat", "lon", "box"]
+
+# Cities that need a more specific query (and cache key) to be geocoded correctly
+GEOCODE_ALIASES = {"Bethlehem, PA": "Bethlehem, PA, USA"}
+
+
+class GeoCache:
+    """An in-memory geocode cache backed by a JSON file (`geo-cache.json` by default).
+
+    The file is read once when the cache is created and all lookups are served from memory. New
+    entries are collected and written back in one atomic write, either when `flush` is called or
+    once `flush_every` unsaved entries have accumulated.
+
+    Cities that could not be geocoded are stored as `{"failed": <timestamp>}` and are treated as
+    known (with empty geodata) until `failure_ttl` has passed, after which they are tried again.
+
+    `hits` and `misses` count the cities that `geocode_cities` found in the cache (fresh) and the
+    ones it had to geocode, respectively.
+    """
+
+    def __init__(
+        self, path="geo-cache.json", flush_every=25, failure_ttl=datetime.timedelta(days=30)
+    ):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.failure_ttl = failure_ttl
+        self.hits = 0
+        self.misses = 0
+        self.unsaved = 0
+
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text())
+        else:
+            self.data = {}
+
+    def __contains__(self, city):
+        return city in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def is_stale(self, city):
+        """Returns `True` if `city` has never been geocoded or if its cached failure has expired."""
+        if not city in self.data:
+            return True
+
+        failed = self.data[city].get("failed")
+        if not failed:
+            return False
+
+        if self.failure_ttl is None:
+            return False
+
+        failed = datetime.datetime.strptime(failed, "%Y-%m-%d %H:%M:%S")
+        return datetime.datetime.now() - failed > self.failure_ttl
+
+    def get(self, city):
+        """Returns the cached geodata for `city` (or `None` if it has not been geocoded yet).
+
+        Cities with a cached failure return an empty dictionary until the failure expires."""
+        if self.is_stale(city):
+            return None
+
+        if "failed" in self.data[city]:
+            return {}
+
+        return self.data[city]
+
+    def set(self, city, geo_data):
+        self.data[city] = geo_data
+        self.unsaved += 1
+
+        if self.flush_every and self.unsaved >= self.flush_every:
+            self.flush()
+
+    def set_failed(self, city):
+        self.set(city, {"failed": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+
+    def flush(self):
+        """Writes the cache to disk if it holds any unsaved entries."""
+        if not self.unsaved:
+            return False
+
+        atomic_write_text(self.path, json.dumps(self.data))
+        log(f"Geo cache saved ({self.unsaved} new entries).", verbose=debug)
+        self.unsaved = 0
+
+        return True
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.data)}
+
+
+def clean_city(cities):
+    """Returns the geocoding key for each value in the `cities` Series (with any `?` removed)."""
+    return cities.astype(str).str.replace("?", "", regex=False)
+
+
+def add_geo_columns(
+    df,
+    geo_data,
+    columns={"": "City", "norm-": "Normalized City"},
+    exclude=["—", "", "Kursaal, Geneva"],
+):
+    """Adds `lat`, `lon` and `box` columns (plus a set for every other prefix in `columns`) to `df` in place.
+
+    `geo_data` is a dictionary of cleaned city names and their geodata, which is turned into a single
+    lookup frame that every key column is joined against. Rows with an excluded or unknown city get `None`.
+    """
+
+    lookup = pd.DataFrame(
+        {
+            field: pd.Series(
+                {city: data.get(field) for city, data in geo_data.items()}, dtype=object
+            )
+            for field in GEO_FIELDS
+        },
+        columns=GEO_FIELDS,
+    )
+
+    for prefix, column in columns.items():
+        keys = clean_city(df[column])
+        found = (keys.isin(lookup.index) & ~keys.isin(exclude)).to_numpy()
+        matched = lookup.reindex(keys.to_numpy())
+
+        for field in GEO_FIELDS:
+            df[f"{prefix}{field}"] = pd.Series(
+                np.where(found, matched[field].to_numpy(dtype=object), None),
+                index=df.index,
+                dtype=object,
+            )
+
+    return df
+
+
+class RateLimiter:
+    """A thread-safe limiter that spaces out calls to `wait` to at most `rate` per second."""
+
+    def __init__(self, rate=1.0):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class StubGeocoder:
+    """A local stand-in for `geopy`'s geocoders, for use in tests and benchmarks.
+
+    If `known` (a dictionary of query and `raw` result) is provided, any other query fails to
+    geocode. Otherwise, every query succeeds with made-up (but stable) coordinates. `delay` can be
+    used to simulate the network round trip.
+    """
+
+    def __init__(self, known=None, delay=0.0):
+        self.known = known
+        self.delay = delay
+        self.calls = 0
+
+    def geocode(self, query):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+        if self.known is not None:
+            raw = self.known.get(query)
+            return SimpleNamespace(raw=raw) if raw else None
+
+        h = int(hashlib.sha1(query.encode("utf-8")).hexdigest(), 16)
+        lat, lon = (h % 18000) / 100 - 90, (h // 18000 % 36000) / 100 - 180
+        return SimpleNamespace(
+            raw={
+                "lat": str(lat),
+                "lon": str(lon),
+                "boundingbox": [str(lat - 0.1), str(lat + 0.1), str(lon - 0.1), str(lon + 0.1)],
+            }
+        )
+
+
+def get_geocoder(backend="nominatim", user_agent="drag-dissertation", timeout=10):
+    """Returns the geocoder for the `backend` set in `settings.yml` (`nominatim` or `stub`)."""
+    if backend == "nominatim":
+        from geopy.geocoders import Nominatim
+
+        return Nominatim(user_agent=user_agent, timeout=timeout)
+
+    if backend == "stub":
+        return StubGeocoder()
+
+    raise RuntimeError(f"Unknown geocoding backend: {backend}")
+
+
+def geocode_cities(
+    cities,
+    geo_cache,
+    geocoder,
+    workers=2,
+    requests_per_second=1.0,
+    retries=3,
+    backoff=2.0,
+    verbose=True,
+):
+    """Geocodes every city in `cities` that is missing (or stale) in `geo_cache`.
+
+    Queries are run by a pool of `workers` threads that share one rate limit. A query that raises
+    is retried up to `retries` times with exponential backoff (`backoff`, `backoff * 2`, ...). A
+    query that returns no result is cached as a failure; one that keeps raising is left uncached
+    so that it is tried again on the next run. Returns a dictionary with counts per outcome. The
+    cities that are already in the cache count as hits of `geo_cache`, the others as misses.
+    """
+
+    queries = sorted(set(GEOCODE_ALIASES.get(city, city) for city in cities))
+    cached = len(queries)
+    queries = [query for query in queries if geo_cache.is_stale(query)]
+
+    geo_cache.hits += cached - len(queries)
+    geo_cache.misses += len(queries)
+
+    counts = {"geocoded": 0, "failed": 0, "errors": 0}
+    if not queries:
+        return counts
+
+    log(f"Geocoding {len(queries)} new cities...", verbose=verbose)
+
+    limiter = RateLimiter(requests_per_second)
+
+    def resolve(query):
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                return geocoder.geocode(query)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                log(f"   retrying {query} ({e})", verbose=verbose)
+                time.sleep(backoff * 2 ** attempt)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(resolve, query): query for query in queries}
+        for future in as_completed(futures):
+            query = futures[future]
+            try:
+                d = future.result()
+            except Exception as e:
+                log(f"ERROR: Geocoding {query} failed ({e})", verbose=verbose)
+                counts["errors"] += 1
+                continue
+
+            if not d:
+                log(f"ERROR: Could not geocode {query}", verbose=verbose)
+                geo_cache.set_failed(query)
+                counts["failed"] += 1
+                continue
+
+            log(f"   geocoded {query}", verbose=verbose)
+            geo_cache.set(
+                query,
+                {
+                    "box": d.raw.get("boundingbox"),
+                    "lat": d.raw.get("lat"),
+                    "lon": d.raw.get("lon"),
+                },
+            )
+            counts["geocoded"] += 1
+
+    return counts
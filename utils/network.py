@@ -1,14 +1,26 @@
-from . import log, debug
+from . import log, debug, save_frame, load_frame
+from .sources import get_source_cache, read_csv_source
+from pathlib import Path
+import networkx as nx
+import numpy as np
 import pandas as pd
-import re
 import datetime
+import hashlib
+import json
+import re
+
+
+# Bump when `filter_data` or `clean_data` change their output, to invalidate cached clean data
+CLEAN_DATA_VERSION = 2
+
+CATEGORICAL_COLUMNS = ["Performer", "Venue", "City", "Revue"]
 
 
 def get_raw_data(
     verbose=True,
     url="https://docs.google.com/spreadsheets/d/e/2PACX-1vT0E0Y7txIa2pfBuusA1cd8X5OVhQ_D0qZC8D40KhTU3xB7McsPR2kuB7GH6ncmNT3nfjEYGbscOPp0/pub?gid=254069133&single=true&output=csv",
 ):
-    df = pd.read_csv(url)
+    df = read_csv_source(url)
 
     df.replace("—", "", inplace=True)
     df.replace("—*", "", inplace=True)
@@ -21,92 +33,130 @@ def get_raw_data(
 
 
 def clean_data(df, drop_cols=[], verbose=True, forbidden=["?", "[", "]"]):
-    def get_performer(row, null_value=""):
-        """(internal) for use with DataFrame lambda function to return the cleaned-up version of a performer's name (in an order of priority)"""
-
-        first_name = row["Performer first-name"]
-        last_name = row["Performer last-name"]
-
-        returnVal = None
-
-        if not returnVal and (last_name and not first_name):
-            returnVal = last_name
-
-        if not returnVal and (
-            row["Normalized performer"]
-            and not "—" in row["Normalized performer"]
-            and not "–" in row["Normalized performer"]
-        ):
-            returnVal = row["Normalized performer"]
+    """Resolves the cleaned-up `Performer`, `City`, `Source`, `Revue` and `Unique venue` (renamed `Venue`) columns.
 
-        if not returnVal and (first_name and last_name):
-            if not "—" in first_name and not "—" in last_name:
-                returnVal = f"{first_name} {last_name}"
+    Each column is resolved for all rows at once: every candidate value is given a mask, and the first candidate
+    (in order of priority) whose mask is set is picked with `np.select`."""
 
-            elif not "—" in last_name and "—" in first_name:
-                returnVal = last_name
+    def is_set(values):
+        """(internal) returns a mask of the values that are truthy (i.e. not empty)"""
+        return values.astype(bool).to_numpy()
 
-            elif not "—" in first_name and "—" in last_name:
-                returnVal = first_name
+    def contains(values, search):
+        """(internal) returns a mask of the values that contain the string `search`"""
+        return values.astype(str).str.contains(search, regex=False).to_numpy()
 
-        if not returnVal and row["Performer"]:
-            returnVal = row["Performer"]
+    def text(values):
+        """(internal) returns the values as an array of strings, ready to be concatenated"""
+        return values.astype(str).to_numpy(dtype=object)
 
-        if not returnVal:
-            return null_value
-
-        return "".join([x for x in returnVal if not x in forbidden])
-
-    def get_city(row, null_value=""):
-        """(internal) for use with DataFrame lambda function to return the cleaned-up version of a city's name (in an order of priority)"""
-        for r in ["Normalized City", "City"]:
-            if row[r]:
-                return row[r]
+    def pick(conditions, choices, null_value=""):
+        """(internal) returns a Series with the first choice, per row, whose condition is met"""
+        return pd.Series(
+            np.select(conditions, choices, default=null_value).astype(object),
+            index=df.index,
+            dtype=object,
+        )
 
-        return null_value
+    def first_set(columns, null_value=""):
+        """(internal) returns the value of the first non-empty column in `columns`, per row"""
+        return pick(
+            [is_set(df[col]) for col in columns],
+            [df[col].to_numpy(dtype=object) for col in columns],
+            null_value=null_value,
+        )
 
-    def get_unique_venue(row, null_value=""):
-        """(internal) for use with DataFrame lambda function to return the cleaned-up version of a venue's name (in an order of priority)"""
-        if row["Normalized Venue"] and row["City"]:
-            return row["Normalized Venue"] + " (" + row["City"] + ")"
+    def get_performer(null_value=""):
+        """(internal) returns the cleaned-up version of the performers' names (in an order of priority)"""
+        first_name = df["Performer first-name"]
+        last_name = df["Performer last-name"]
+        normalized = df["Normalized performer"]
+
+        has_first, has_last = is_set(first_name), is_set(last_name)
+        dash_first, dash_last = contains(first_name, "—"), contains(last_name, "—")
+
+        performers = pick(
+            [
+                has_last & ~has_first,
+                is_set(normalized)
+                & ~contains(normalized, "—")
+                & ~contains(normalized, "–"),
+                has_first & has_last & ~dash_first & ~dash_last,
+                has_first & has_last & ~dash_last & dash_first,
+                has_first & has_last & ~dash_first & dash_last,
+                is_set(df["Performer"]),
+            ],
+            [
+                last_name.to_numpy(dtype=object),
+                normalized.to_numpy(dtype=object),
+                text(first_name) + " " + text(last_name),
+                last_name.to_numpy(dtype=object),
+                first_name.to_numpy(dtype=object),
+                df["Performer"].to_numpy(dtype=object),
+            ],
+            null_value=null_value,
+        )
 
-        if row["Venue"] and row["City"]:
-            return row["Venue"] + " (" + row["City"] + ")"
+        forbidden_chars = str.maketrans({x: None for x in forbidden if len(x) == 1})
+        return performers.str.translate(forbidden_chars)
+
+    def get_source(null_value=""):
+        """(internal) returns the cleaned-up version of the sources (in an order of priority)"""
+        sources = first_set(["Source clean", "Source"], null_value=null_value)
+
+        has_source = is_set(sources)
+        has_date = (
+            sources.astype(str)
+            .str.contains(r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)")
+            .to_numpy()
+        ) | sources.astype(str).str.contains(r"\d{4}-\d{2}-\d{2}").to_numpy()
+        needs_date = has_source & ~has_date
+
+        dates = df["Date"][needs_date]
+        dates = dates.map(
+            {
+                date: datetime.datetime.strptime(date, "%Y-%m-%d").strftime("%B %d, %Y")
+                for date in set(dates)
+            }
+        )
 
-        for r in ["Venue", "City"]:
-            if row[r]:
-                return row[r]
+        dated_sources = sources.copy()
+        dated_sources[needs_date] = (
+            text(sources[needs_date]) + " (" + dates.to_numpy(dtype=object) + ")"
+        )
 
-        return null_value
+        # Rows without a source have always been given `(null_value,)` (which ends up as `[""]` in the JSON files)
+        for ix in dated_sources.index[~has_source]:
+            dated_sources.at[ix] = (null_value,)
+
+        return dated_sources
+
+    def get_unique_venue(null_value=""):
+        """(internal) returns the cleaned-up version of the venues' names, with their city (in an order of priority)"""
+        normalized, venue, city = df["Normalized Venue"], df["Venue"], df["City"]
+        has_city = is_set(city)
+
+        return pick(
+            [
+                is_set(normalized) & has_city,
+                is_set(venue) & has_city,
+                is_set(venue),
+                has_city,
+            ],
+            [
+                text(normalized) + " (" + text(city) + ")",
+                text(venue) + " (" + text(city) + ")",
+                venue.to_numpy(dtype=object),
+                city.to_numpy(dtype=object),
+            ],
+            null_value=null_value,
+        )
 
-    def get_source(row, null_value=""):
-        """(internal) for use with DataFrame lambda function to return the cleaned-up version of a source (in an order of priority)"""
-        for r in ["Source clean", "Source"]:
-            if row[r]:
-                g = re.search(
-                    r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)", row[r]
-                )
-                if not g:
-                    g = re.search(r"\d{4}-\d{2}-\d{2}", row[r])
-                    if not g:
-                        return f"{row[r]} ({datetime.datetime.strptime(row['Date'], '%Y-%m-%d').strftime('%B %d, %Y')})"
-                return row[r]
-
-        return (null_value,)
-
-    def get_revue(row, null_value=""):
-        """(internal) for use with DataFrame lambda function to return the cleaned-up version of a revue's name (in an order of priority)"""
-        for r in ["Normalized Revue Name", "Revue name"]:
-            if row[r]:
-                return row[r]
-
-        return null_value
-
-    df["Performer"] = df.apply(lambda row: get_performer(row), axis=1)
-    df["City"] = df.apply(lambda row: get_city(row), axis=1)
-    df["Source"] = df.apply(lambda row: get_source(row), axis=1)
-    df["Revue"] = df.apply(lambda row: get_revue(row), axis=1)
-    df["Unique venue"] = df.apply(lambda row: get_unique_venue(row), axis=1)
+    df["Performer"] = get_performer()
+    df["City"] = first_set(["Normalized City", "City"])
+    df["Source"] = get_source()
+    df["Revue"] = first_set(["Normalized Revue Name", "Revue name"])
+    df["Unique venue"] = get_unique_venue()
     log(f"**Cleaned up all names**.", verbose=verbose)
 
     for col in drop_cols:
@@ -126,58 +176,62 @@ def clean_data(df, drop_cols=[], verbose=True, forbidden=["?", "[", "]"]):
 
 
 def filter_data(df, min_date=None, max_date=None, verbose=True, skip_unsure=False):
-    def has_required_data(row):
-        """(internal) for use with DataFrame lambda function to ensure that any given row has the required data present"""
-        has_performer = (
-            row["Performer"] != ""
-            or row["Normalized performer"] != ""
-            or (row["Performer first-name"] != "" or row["Performer last-name"]) != ""
-        )
-        has_venue = row["Venue"] != ""
-        if has_performer and has_venue:
-            return True
-        else:
-            return False
+    """Filters out the rows that lack required data, are excluded or unsure, or lack a full date (and, optionally, fall outside of a date range).
 
-    def has_correct_date(row):
-        """(internal) for use with DataFrame lambda function to ensure that any given row has a correct date present"""
-        return re.search(r"\d{4}\-\d{2}\-\d{2}", row["Date"]) != None
+    All the criteria are combined into one mask that is applied once; the row count after each criterion is still logged."""
 
-    def string_date(row):
-        return row["Date"].strftime("%Y-%m-%d")
+    def is_checked(values):
+        """(internal) returns a mask of the values that are checked in the spreadsheet"""
+        return ((values == True) | (values == "TRUE")).to_numpy()
 
-    df = df.copy()
+    has_performer = (
+        (df["Performer"] != "")
+        | (df["Normalized performer"] != "")
+        | (df["Performer first-name"] != "")
+        | (df["Performer last-name"] != "")
+    )
+    has_required_data = (has_performer & (df["Venue"] != "")).to_numpy()
 
-    df["has_required_data"] = df.apply(lambda row: has_required_data(row), axis=1)
-    df.drop(df[df["has_required_data"] == False].index, inplace=True)
-    log(f"**{df.shape[0]} rows after filtering**: Required data.", verbose=verbose)
+    keep = has_required_data
+    log(f"**{keep.sum()} rows after filtering**: Required data.", verbose=verbose)
 
-    df.drop(df[df["Exclude from visualization"] == True].index, inplace=True)
-    df.drop(df[df["Exclude from visualization"] == "TRUE"].index, inplace=True)
+    keep = keep & ~is_checked(df["Exclude from visualization"])
     log(
-        f"**{df.shape[0]} rows after filtering**: Exclusion from visulization.",
+        f"**{keep.sum()} rows after filtering**: Exclusion from visulization.",
         verbose=verbose,
     )
 
     if skip_unsure == False:
-        df.drop(df[df["Unsure whether drag artist"] == True].index, inplace=True)
-        df.drop(df[df["Unsure whether drag artist"] == "TRUE"].index, inplace=True)
+        keep = keep & ~is_checked(df["Unsure whether drag artist"])
         log(
-            f"**{df.shape[0]} rows after filtering**: Unsure whether drag artist.",
+            f"**{keep.sum()} rows after filtering**: Unsure whether drag artist.",
             verbose=verbose,
         )
 
-    df["has_correct_date"] = df.apply(lambda row: has_correct_date(row), axis=1)
-    df.drop(df[df["has_correct_date"] == False].index, inplace=True)
+    has_correct_date = (
+        df["Date"].astype(str).str.contains(r"\d{4}\-\d{2}\-\d{2}").to_numpy()
+    )
+    keep = keep & has_correct_date
     log(
-        f"**{df.shape[0]} rows after filtering**: Full date in `Date` column.",
+        f"**{keep.sum()} rows after filtering**: Full date in `Date` column.",
         verbose=verbose,
     )
 
+    df = df[keep].copy()
+    df["has_required_data"] = True
+    df["has_correct_date"] = True
+
     if min_date or max_date:
-        df["Date"] = pd.to_datetime(df["Date"])
-        df = df[(df["Date"] > min_date) & (df["Date"] < max_date)]
-        df["Date"] = df.apply(lambda row: string_date(row), axis=1)
+        dates = pd.to_datetime(df["Date"])
+
+        in_range = pd.Series(True, index=df.index)
+        if min_date:
+            in_range &= dates > min_date
+        if max_date:
+            in_range &= dates < max_date
+
+        df = df[in_range]
+        df["Date"] = dates[in_range].dt.strftime("%Y-%m-%d")
         log(
             f"**{df.shape[0]} rows after filtering**: Min and max date set.",
             verbose=verbose,
@@ -192,11 +246,14 @@ def get_clean_network_data(
     drop_cols=None,
     verbose=True,
     url="https://docs.google.com/spreadsheets/d/e/2PACX-1vT0E0Y7txIa2pfBuusA1cd8X5OVhQ_D0qZC8D40KhTU3xB7McsPR2kuB7GH6ncmNT3nfjEYGbscOPp0/pub?gid=254069133&single=true&output=csv",
+    skip_unsure=False,
+    cache_dir=".cache/network",
 ):
-    """A "collector" function that runs through `get_raw_data`, `filter_data` and `clean_data` in that order and then resets the index."""
+    """A "collector" function that runs through `get_raw_data`, `filter_data` and `clean_data` in that order and then resets the index.
 
-    df = get_raw_data(verbose=verbose, url=url)
-    df = filter_data(df, min_date=min_date, max_date=max_date, verbose=verbose)
+    The result (with `CATEGORICAL_COLUMNS` as categoricals) is saved in `cache_dir`, keyed by the checksum of the raw data
+    and the filter and clean parameters, and loaded from there on later calls. Only the last result is kept: the ones
+    saved before it (for other data or parameters) are deleted. Set `cache_dir` to `None` to skip the cache."""
 
     if not drop_cols:
         drop_cols = [
@@ -238,11 +295,48 @@ def get_clean_network_data(
             "Normalized Venue",
         ]
 
+    if cache_dir:
+        key = hashlib.sha256(
+            json.dumps(
+                {
+                    "version": CLEAN_DATA_VERSION,
+                    "source": get_source_cache().fetch(url),
+                    "min_date": str(min_date),
+                    "max_date": str(max_date),
+                    "drop_cols": drop_cols,
+                    "skip_unsure": skip_unsure,
+                }
+            ).encode("utf-8")
+        ).hexdigest()
+        cache_file = Path(cache_dir) / f"clean-network-data-{key}"
+
+        df = load_frame(cache_file)
+        if df is not None:
+            log(f"**{df.shape[0]} rows loaded from cached clean data**.", verbose=verbose)
+            return df
+
+    df = get_raw_data(verbose=verbose, url=url)
+    df = filter_data(
+        df,
+        min_date=min_date,
+        max_date=max_date,
+        verbose=verbose,
+        skip_unsure=skip_unsure,
+    )
+
     df = clean_data(df, drop_cols, verbose=verbose)
 
     df = df.reset_index(drop=True)
     log(f"**Index has been reset**.", verbose=verbose)
 
+    df = df.astype({col: "category" for col in CATEGORICAL_COLUMNS if col in df})
+
+    if cache_dir:
+        saved = save_frame(df, cache_file)
+        for path in Path(cache_dir).glob("clean-network-data-*"):
+            if path != saved:
+                path.unlink()
+
     return df
 
 
@@ -334,6 +428,19 @@ def get_meta(
 # Group data
 
 
+def sort_dates(dates, dateformat="%Y-%m-%d"):
+    """Parses the date strings in `dates` (following `dateformat`) and returns them as sorted datetimes."""
+    try:
+        return sorted([datetime.datetime.strptime(x, dateformat) for x in dates])
+    except ValueError as e:
+        date = re.search(r"""['"](.*)['"] does not match format""", str(e))
+        if date:
+            date = date.groups()[0]
+        raise ValueError(
+            f"A date found in list that did not adhere to format (`{date}`). Needs to follow format `{dateformat}`."
+        ) from None
+
+
 def group_dates(
     dates: list = [], delta=datetime.timedelta(days=14), dateformat="%Y-%m-%d"
 ):
@@ -368,15 +475,7 @@ def group_dates(
 
     """
 
-    try:
-        dates = sorted([datetime.datetime.strptime(x, dateformat) for x in dates])
-    except ValueError as e:
-        date = re.search(r"""['"](.*)['"] does not match format""", str(e))
-        if date:
-            date = date.groups()[0]
-        raise ValueError(
-            f"A date found in list that did not adhere to format (`{date}`). Needs to follow format `{dateformat}`."
-        ) from None
+    dates = sort_dates(dates, dateformat)
 
     if isinstance(delta, int):
         delta = datetime.timedelta(days=delta)
@@ -448,34 +547,89 @@ def group_dates(
     return periods
 
 
+def group_dates_multi(
+    dates: list = [], deltas=[3, 14, 31, 93, 186, 365], dateformat="%Y-%m-%d"
+):
+    """Chains dates together like `group_dates`, but for several deltas at once.
+
+    Returns a dictionary of every delta in `deltas` and its periods, identical to `group_dates(dates, delta)`.
+    The dates are only parsed and sorted once: a chain breaks wherever the gap between two consecutive dates is
+    larger than the delta, so the gaps are compared against all the deltas in one step.
+
+    Example:
+
+    group_dates_multi(['1935-01-13', '1935-01-26', '1935-04-01'], deltas=[3, 14])
+    -> {
+        3: [['1935-01-13'], ['1935-01-26'], ['1935-04-01']],
+        14: [['1935-01-13', '1935-01-26'], ['1935-04-01']]
+    }
+    """
+
+    dates = sort_dates(dates, dateformat)
+    date_strs = [date.strftime("%Y-%m-%d") for date in dates]
+
+    if not dates:
+        return {delta: [] for delta in deltas}
+
+    thresholds = np.array(
+        [
+            datetime.timedelta(days=delta) if isinstance(delta, int) else delta
+            for delta in deltas
+        ],
+        dtype="timedelta64[us]",
+    )
+    gaps = np.diff(np.array(dates, dtype="datetime64[us]"))
+    breaks = gaps[np.newaxis, :] > thresholds[:, np.newaxis]
+
+    periods = {}
+    for delta, delta_breaks in zip(deltas, breaks):
+        starts = [0, *(np.flatnonzero(delta_breaks) + 1).tolist()]
+        ends = [*starts[1:], len(dates)]
+        periods[delta] = [date_strs[start:end] for start, end in zip(starts, ends)]
+
+    return periods
+
+
 def get_group_data(df, days=[3, 14, 31, 93, 186, 365], verbose=False):
-    def get_performers_who_were_there(df, where=None, when=[]):
+    # Index of the performers at every venue on every date, built in one pass over the data
+    performers_by_venue_and_date = {
+        venue_and_date: set(performers)
+        for venue_and_date, performers in df.groupby(["Venue", "Date"], observed=True)[
+            "Performer"
+        ]
+    }
+
+    def get_performers_who_were_there(where=None, when=[]):
         """Returns a list of all the performers from any list of dates and venue"""
 
         """
         How this function works:
-        get_performers_who_were_there(df, 'Band Box (Syracuse, NY)', ['1935-03-29', '1935-04-05', '1935-04-12', '1935-04-19'])
+        get_performers_who_were_there('Band Box (Syracuse, NY)', ['1935-03-29', '1935-04-05', '1935-04-12', '1935-04-19'])
         """
         if not isinstance(when, list):
             when = [when]
 
-        all_values = []
+        all_values = set()
         for when in when:
             if isinstance(when, datetime.datetime):
                 when = when.strftime("%Y-%m-%d")
 
-            selected_rows = df[(df["Date"] == when) & (df["Venue"] == where)]
-
-            all_values.extend(selected_rows["Performer"])
+            all_values.update(performers_by_venue_and_date.get((where, when), ()))
 
-        return sorted(list(set(all_values)))
+        return sorted(all_values)
 
     data_dict = {}
 
-    venue_count = len(df.groupby("Venue"))
+    venue_count = df["Venue"].nunique()
     i = 1
     for venue, row in df.groupby("Venue"):
+        if row.empty:  # unused categories of a categorical `Venue` column
+            continue
+
         i += 1
+        revues = sorted(set([x for x in row.Revue if x]))
+        cities = sorted(set([x for x in row.City if x]))
+        grouped_dates_per_span = group_dates_multi(list(set(row.Date)), deltas=days)
         for num_days in days:
             log(
                 f'Generating group data for spans of {", ".join([str(x) for x in days])} days.',
@@ -485,24 +639,446 @@ def get_group_data(df, days=[3, 14, 31, 93, 186, 365], verbose=False):
                 f"   [{i}/{venue_count}] processing venue {venue} (date span {num_days} days)...",
                 verbose=verbose,
             )
-            all_dates = list(set(row.Date))
-            grouped_dates = group_dates(
-                all_dates, delta=datetime.timedelta(days=num_days)
-            )
+            grouped_dates = grouped_dates_per_span[num_days]
             for ix, date_group in enumerate(grouped_dates, start=1):
                 if not venue in data_dict:
                     data_dict[venue] = {}
                 if not f"grouped-by-{num_days}-days" in data_dict[venue]:
                     data_dict[venue][f"grouped-by-{num_days}-days"] = {}
 
-                revues = list(set([x for x in row.Revue if x]))
-                cities = list(set([x for x in row.City if x]))
-
                 data_dict[venue][f"grouped-by-{num_days}-days"][f"date_group-{ix}"] = {
                     "dates": date_group,
-                    "performers": get_performers_who_were_there(df, venue, date_group),
+                    "performers": get_performers_who_were_there(venue, date_group),
                     "revues": revues,
                     "cities": cities,
                 }
     log(f"Generated group data for {venue_count} venues.", verbose=debug)
     return data_dict
+
+
+GROUP_DATA_COLUMNS = ["Venue", "Date", "Performer", "Revue", "City"]
+
+
+def get_venue_checksums(df):
+    """Returns a checksum of the rows of every venue in `df`, as far as `get_group_data` is concerned.
+
+    Each venue's checksum is its number of rows and the sum of their hashes (of the `GROUP_DATA_COLUMNS`), so it does not
+    depend on the order of the rows."""
+    hashes = pd.util.hash_pandas_object(df[GROUP_DATA_COLUMNS], index=False)
+    grouped = hashes.groupby(df["Venue"].astype(str).to_numpy())
+    sums, counts = grouped.sum(), grouped.size()
+
+    return {venue: (int(counts[venue]), int(sums[venue])) for venue in counts.index}
+
+
+def get_changed_keys(previous, current):
+    """Returns the set of keys whose values differ between the dictionaries `previous` and `current` (including the
+    keys that are only in one of them)."""
+    return {key for key in previous.keys() | current.keys() if previous.get(key) != current.get(key)}
+
+
+def update_group_data(previous, df, venues, days=[3, 14, 31, 93, 186, 365]):
+    """Returns the group data (see `get_group_data`) for `df`, given `previous`, the group data from earlier data in which
+    only the rows of `venues` were different. Only the group data for `venues` is generated again."""
+    data_dict = get_group_data(df[df["Venue"].isin(venues)], days=days)
+
+    # Venues come in the same order as in `get_group_data`
+    sizes = df.groupby("Venue").size()
+    return {
+        venue: data_dict[venue] if venue in venues else previous[venue]
+        for venue in sizes[sizes > 0].index
+        if venue in data_dict or (not venue in venues and venue in previous)
+    }
+
+
+def get_group_data_checksums(group_data_dict):
+    """Returns a checksum of the group data of every venue."""
+    return {
+        venue: hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+        for venue, data in group_data_dict.items()
+    }
+
+
+# Networks
+
+
+def build_networks(group_data_dict, variants={"": None}):
+    """Builds co-occurrence networks (`nx.Graph`) for every date span in the group data (see `get_group_data`).
+
+    `variants` maps a suffix for the networks' keys to a node filter (a function that returns `True` for the performers
+    to keep, or `None` to keep all of them), and one network is built per date span and variant, keyed
+    `f"{grouped_by}{suffix}"`. A filtered network is the same as a subgraph of the unfiltered one: it keeps the performers
+    that pass the filter (even if all their co-performers were dropped) and the edges between them.
+
+    Performers are interned to integer IDs and every unordered pair of performers in a date group is visited once. The
+    edges' `coLocated` (venue -> list of date groups), `revues` and `cities` attributes are collected in a table keyed
+    by the pair of IDs before the finished graphs are created. Nodes and edges are added in order of first appearance.
+    """
+
+    generated = datetime.datetime.now()
+
+    performer_ids = {}
+    performers = []
+    kept = {suffix: [] for suffix in variants}
+    needed = []
+
+    tables = {}
+
+    for venue, data in group_data_dict.items():
+        for grouped_by, data2 in data.items():
+            if not grouped_by in tables:
+                tables[grouped_by] = {"nodes": {}, "edges": {}}
+            nodes, edges = tables[grouped_by]["nodes"], tables[grouped_by]["edges"]
+
+            for date_group_id, data3 in data2.items():
+                if not len(data3["performers"]) > 1:
+                    continue
+
+                ids = []
+                for performer in data3["performers"]:
+                    if not performer in performer_ids:
+                        performer_ids[performer] = len(performers)
+                        performers.append(performer)
+                        for suffix, node_filter in variants.items():
+                            kept[suffix].append(not node_filter or node_filter(performer))
+                        needed.append(any(kept[suffix][-1] for suffix in variants))
+                    ids.append(performer_ids[performer])
+                    nodes[ids[-1]] = None
+
+                dates = data3["dates"]
+                revues = data3["revues"]
+                cities = data3["cities"]
+                ids = [x for x in ids if needed[x]]
+                for ix, source in enumerate(ids):
+                    for target in ids[ix + 1 :]:
+                        key = (source, target) if source < target else (target, source)
+
+                        edge = edges.get(key)
+                        if edge is None:
+                            edge = edges[key] = {
+                                "coLocated": {},
+                                "revues": set(),
+                                "cities": set(),
+                            }
+
+                        if not venue in edge["coLocated"]:
+                            edge["coLocated"][venue] = []
+                        edge["coLocated"][venue].append(dates)
+
+                        edge["revues"].update(revues)
+                        edge["cities"].update(cities)
+
+    networks = {}
+    for grouped_by, table in tables.items():
+        for suffix, keep in kept.items():
+            G = nx.Graph()
+            G.generated = generated
+
+            G.add_nodes_from(performers[node] for node in table["nodes"] if keep[node])
+            G.add_edges_from(
+                (
+                    performers[source],
+                    performers[target],
+                    {
+                        "coLocated": {
+                            venue: list(date_groups)
+                            for venue, date_groups in edge["coLocated"].items()
+                        },
+                        "revues": sorted(edge["revues"]),
+                        "cities": sorted(edge["cities"]),
+                    },
+                )
+                for (source, target), edge in table["edges"].items()
+                if keep[source] and keep[target]
+            )
+
+            networks[f"{grouped_by}{suffix}"] = G
+
+    return networks
+
+
+def update_networks(networks, group_data_dict, venues, variants={"": None}):
+    """Returns the networks (see `build_networks`) for `group_data_dict`, given `networks`, the networks built from
+    earlier group data in which only the group data of `venues` was different.
+
+    The edges are taken over from `networks` without their date groups at `venues`, after which only the date groups of
+    `venues` are visited. The nodes and edges are put in the same order as `build_networks` would put them in, so the
+    result is the same as building the networks from scratch."""
+
+    generated = datetime.datetime.now()
+
+    venues = set(venues)
+    venue_index = {venue: ix for ix, venue in enumerate(group_data_dict)}
+
+    spans = {}
+    for venue, data in group_data_dict.items():
+        for grouped_by, data2 in data.items():
+            if not grouped_by in spans:
+                spans[grouped_by] = {"nodes": {}, "group_index": {}}
+            nodes, group_index = spans[grouped_by]["nodes"], spans[grouped_by]["group_index"]
+
+            # The first appearance of every performer, and the position of every date group at its venue
+            for ix, data3 in enumerate(data2.values()):
+                group_index[(venue, tuple(data3["dates"]))] = ix
+                if not len(data3["performers"]) > 1:
+                    continue
+                for performer in data3["performers"]:
+                    nodes[performer] = None
+
+    updated = {}
+    for grouped_by, span in spans.items():
+        nodes, group_index = span["nodes"], span["group_index"]
+
+        for suffix, keep in variants.items():
+            key = f"{grouped_by}{suffix}"
+            G = networks.get(key, nx.Graph())
+
+            # The edges' `coLocated`, and the attributes of the edges that are not at any of `venues` (which stay the same)
+            edges, unchanged = {}, {}
+            for source, target, attributes in G.edges(data=True):
+                edge = (source, target) if source < target else (target, source)
+                if venues.isdisjoint(attributes["coLocated"]):
+                    edges[edge] = attributes["coLocated"]
+                    unchanged[edge] = attributes
+                    continue
+
+                co_located = {
+                    venue: date_groups
+                    for venue, date_groups in attributes["coLocated"].items()
+                    if not venue in venues
+                }
+                if co_located:
+                    edges[edge] = co_located
+
+            for venue in venues:
+                if not venue in group_data_dict:
+                    continue
+
+                for data3 in group_data_dict[venue].get(grouped_by, {}).values():
+                    if not len(data3["performers"]) > 1:
+                        continue
+
+                    performers = [x for x in data3["performers"] if not keep or keep(x)]
+                    for ix, source in enumerate(performers):
+                        for target in performers[ix + 1 :]:
+                            co_located = edges.get((source, target))
+                            if co_located is None:
+                                co_located = edges[(source, target)] = {}
+                            elif (source, target) in unchanged:
+                                co_located = edges[(source, target)] = dict(co_located)
+                                del unchanged[(source, target)]
+                            if not venue in co_located:
+                                co_located[venue] = []
+                            co_located[venue].append(data3["dates"])
+
+            def get_order(item):
+                (source, target), co_located = item
+                venue = min(co_located, key=venue_index.get)
+                return (
+                    venue_index[venue],
+                    group_index[(venue, tuple(co_located[venue][0]))],
+                    source,
+                    target,
+                )
+
+            def get_attributes(edge, co_located):
+                if edge in unchanged:
+                    return {
+                        "coLocated": {
+                            venue: list(date_groups) for venue, date_groups in co_located.items()
+                        },
+                        "revues": list(unchanged[edge]["revues"]),
+                        "cities": list(unchanged[edge]["cities"]),
+                    }
+
+                return {
+                    "coLocated": {
+                        venue: list(co_located[venue])
+                        for venue in sorted(co_located, key=venue_index.get)
+                    },
+                    "revues": get_venue_values(co_located, "revues"),
+                    "cities": get_venue_values(co_located, "cities"),
+                }
+
+            def get_venue_values(co_located, attribute):
+                values = set()
+                for venue in co_located:
+                    values.update(next(iter(group_data_dict[venue][grouped_by].values()))[attribute])
+                return sorted(values)
+
+            H = nx.Graph()
+            H.generated = generated
+
+            H.add_nodes_from(node for node in nodes if not keep or keep(node))
+            H.add_edges_from(
+                (source, target, get_attributes((source, target), co_located))
+                for (source, target), co_located in sorted(edges.items(), key=get_order)
+            )
+
+            updated[key] = H
+
+    return updated
+
+
+def get_components(G):
+    """Returns the connected components of `G` as sorted lists of nodes.
+
+    The components are found in a single sweep over the graph and come in order of their first node in `G.nodes`,
+    which makes their position (used as `network_id`) stable between runs on the same data."""
+    return [sorted(component) for component in nx.connected_components(G)]
+
+
+def get_degrees(G):
+    """Returns the `indegree`, `outdegree` and `degree` of every node in `G`, in one pass over its adjacency.
+
+    As `G` is undirected, `indegree` and `outdegree` follow how its edges are listed in `G.edges`: an edge counts towards
+    the `indegree` of the node it is listed from, which is whichever of its nodes comes first in `G.nodes`, and towards
+    the `outdegree` of the other (a self-loop counts towards both)."""
+
+    position = {node: ix for ix, node in enumerate(G.nodes)}
+
+    degrees = {}
+    for node, neighbors in G.adj.items():
+        indegree, outdegree = 0, 0
+        for neighbor in neighbors:
+            if neighbor == node:
+                indegree += 1
+                outdegree += 1
+            elif position[neighbor] > position[node]:
+                indegree += 1
+            else:
+                outdegree += 1
+
+        degrees[node] = {
+            "indegree": indegree,
+            "outdegree": outdegree,
+            "degree": indegree + outdegree,
+        }
+
+    return degrees
+
+
+def get_found_dates(co_located):
+    """Returns the sorted list of every date in an edge's `coLocated` attribute (venue -> list of date groups)."""
+    found = set()
+    for date_groups in co_located.values():
+        for dates in date_groups:
+            found.update(dates)
+
+    return sorted(found)
+
+
+def compact_date_groups(G):
+    """Moves the date groups in the `coLocated` attribute of all of `G`'s edges into one table, `G.graph["dateGroups"]`.
+
+    Each edge's `coLocated` becomes venue -> list of positions in that table, so that every date group is stored once
+    per network rather than once per edge. Returns the table."""
+
+    positions = {}
+    table = []
+
+    for edge in G.edges:
+        co_located = {}
+        for venue, date_groups in G.edges[edge]["coLocated"].items():
+            co_located[venue] = []
+            for dates in date_groups:
+                key = tuple(dates)
+                if not key in positions:
+                    positions[key] = len(table)
+                    table.append(dates)
+                co_located[venue].append(positions[key])
+
+        G.edges[edge]["coLocated"] = co_located
+
+    G.graph["dateGroups"] = table
+
+    return table
+
+
+# Ego networks
+
+
+def get_ego_export(G):
+    """Returns `G` in the compressed sparse row (CSR) format used for the ego network export.
+
+    The network is stored once: `nodes` lists the nodes and `edges` lists each edge's attributes once, with its
+    `source` and `target` as positions in `nodes`. A node's neighbors are `neighbors[offsets[i]:offsets[i + 1]]` (as
+    positions in `nodes`), and the edges that lead to them are at the same positions in `edgeIds`. Any node's ego network
+    can be read from this without storing it separately (see `get_ego_network`), so the export grows with the number of
+    nodes and edges rather than with the total size of all the ego networks.
+    """
+
+    nodes = list(G.nodes)
+    position = {node: ix for ix, node in enumerate(nodes)}
+
+    edges = []
+    edge_ids = {}
+    for source, target, attributes in G.edges(data=True):
+        source, target = position[source], position[target]
+        edge_ids[(source, target)] = edge_ids[(target, source)] = len(edges)
+        edges.append({"source": source, "target": target, **attributes})
+
+    offsets = [0]
+    neighbors = []
+    neighbor_edges = []
+    for node, adjacent in G.adj.items():
+        for neighbor in adjacent:
+            neighbors.append(position[neighbor])
+            neighbor_edges.append(edge_ids[(position[node], position[neighbor])])
+        offsets.append(len(neighbors))
+
+    data = {
+        "format": "csr",
+        "directed": False,
+        "nodes": nodes,
+        "offsets": offsets,
+        "neighbors": neighbors,
+        "edgeIds": neighbor_edges,
+        "edges": edges,
+    }
+
+    if "dateGroups" in G.graph:
+        data["dateGroups"] = G.graph["dateGroups"]
+
+    return data
+
+
+def get_ego_network(data, node, radius=1):
+    """Returns the ego network of `node` (an `nx.Graph` of the nodes within `radius` steps of it, and the edges between
+    them) from an export made by `get_ego_export`. It holds the same nodes and edges as `nx.ego_graph` on the original.
+    """
+
+    nodes, offsets, neighbors, edge_ids, edges = (
+        data["nodes"],
+        data["offsets"],
+        data["neighbors"],
+        data["edgeIds"],
+        data["edges"],
+    )
+
+    center = nodes.index(node)
+    within = {center: 0}
+    frontier = [center]
+    for distance in range(1, radius + 1):
+        next_frontier = []
+        for ix in frontier:
+            for neighbor in neighbors[offsets[ix] : offsets[ix + 1]]:
+                if not neighbor in within:
+                    within[neighbor] = distance
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+
+    H = nx.Graph()
+    H.add_nodes_from(nodes[ix] for ix in within)
+    for ix in within:
+        for pos in range(offsets[ix], offsets[ix + 1]):
+            neighbor = neighbors[pos]
+            if neighbor in within and not H.has_edge(nodes[ix], nodes[neighbor]):
+                edge = edges[edge_ids[pos]]
+                H.add_edge(
+                    nodes[edge["source"]],
+                    nodes[edge["target"]],
+                    **{k: v for k, v in edge.items() if not k in ["source", "target"]},
+                )
+
+    return H
@@ -0,0 +1,32 @@
+from . import log
+
+
+def get_pairing(keys, values):
+    """Returns a dictionary of every key (as a string) and the sorted list of unique values that it is paired with.
+
+    `keys` and `values` are iterables of the same length (usually two of the dataset's columns). Empty (falsy) values
+    are left out, but their keys are included. The values are collected in one pass and every key's values are sorted
+    once, at the end, and the keys come in sorted order."""
+
+    pairing = {}
+    for key, value in zip(keys, values):
+        key = str(key)
+
+        found = pairing.get(key)
+        if found is None:
+            found = pairing[key] = set()
+
+        if value:
+            found.add(value)
+
+    return {key: sorted(pairing[key]) for key in sorted(pairing)}
+
+
+def get_pairings(df, pairings, verbose=True):
+    """Returns the pairing (see `get_pairing`) of every `(k, v)` column pair in `pairings`, keyed `f"{k}-{v}"`."""
+    results = {}
+    for k, v in pairings:
+        log(f"   ... {k} - {v}", verbose=verbose)
+        results[f"{k}-{v}"] = get_pairing(df[k], df[v])
+
+    return results
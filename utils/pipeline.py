@@ -0,0 +1,630 @@
+from . import (
+    log,
+    get_manifest,
+    track_peak_rss,
+    save_json,
+    save_result,
+    changed_files,
+    write_stats,
+    slugify,
+    slugify_edge,
+    Timer,
+)
+from .sources import get_source_cache, read_csv_source
+from .stages import Stage, StageStore, Pipeline
+from pathlib import Path
+import pandas as pd
+import datetime
+import json
+import os
+import re
+
+
+# The stages that write the published files, in the order `sync-data.py` runs them
+TARGETS = ["dataset", "values", "pairings", "network", "ego"]
+
+# The targets of each command of the command line interface (see `utils/__main__.py`)
+COMMANDS = {
+    "fetch": ["dataset"],
+    "values": ["values"],
+    "pairings": ["pairings"],
+    "network": ["network"],
+    "ego": ["ego"],
+    "all": TARGETS,
+}
+
+
+# PART I. MAIN DATASET
+
+
+def fetch(pipeline):
+    """Reads in the main dataset (`urls.live`) and fixes its missing values and number columns."""
+    df = read_csv_source(pipeline.settings["urls"]["live"])
+    log("Dataframe loaded.")
+
+    df["Alleged age"] = df["Alleged age"].fillna(0)
+    df["Assumed birth year"] = df["Assumed birth year"].fillna(0)
+    df["EIMA_ID"] = df["EIMA_ID"].fillna(0)
+    df = df.astype(
+        {
+            "Alleged age": int,
+            "Assumed birth year": int,
+            "EIMA_ID": int,
+        }
+    )
+    df.fillna("", inplace=True)
+
+    log("Dataframe fixed.")
+
+    return df
+
+
+def geocode(pipeline, df):
+    """Geocodes the cities in the dataset that are not in the geo cache yet and adds the geo columns to `df`.
+
+    The geo cache is not part of the stage's fingerprint, so cities whose failure has expired are only tried again
+    when the dataset changes (or with `--force geocode`)."""
+    from .geo import (
+        GeoCache,
+        GEOCODE_ALIASES,
+        add_geo_columns,
+        geocode_cities,
+        get_geocoder,
+    )
+
+    options = pipeline.settings["geocoding"]
+
+    geo_cache = GeoCache(
+        "geo-cache.json",
+        failure_ttl=datetime.timedelta(days=options["failure-ttl-days"]),
+    )
+    geolocator = get_geocoder(backend=options["backend"], user_agent=options["user-agent"])
+
+    def get_geodata(city):
+        return geo_cache.get(GEOCODE_ALIASES.get(city, city)) or {}
+
+    cities = [x for x in df.City if not x == "—"]
+    cities.extend([x for x in df["Normalized City"] if not x == "—"])
+    cities = list(set([x.replace("?", "") for x in cities]))
+    cities = [city for city in cities if city and city != "Kursaal, Geneva"]
+
+    geocoding_counts = geocode_cities(
+        cities,
+        geo_cache,
+        geolocator,
+        workers=options["workers"],
+        requests_per_second=options["requests-per-second"],
+        retries=options["retries"],
+        backoff=options["backoff"],
+    )
+    geo_cache.flush()
+
+    cities = {city: get_geodata(city) for city in cities}
+
+    log(
+        f"Data generated (geodata). Geo cache: {geo_cache.hits} hits, {geo_cache.misses} misses; {geocoding_counts['geocoded']} cities geocoded, {geocoding_counts['failed']} failed, {geocoding_counts['errors']} errors."
+    )
+
+    # Add `lat`, `lon`, `box` and their `norm-` counterparts from the geodata
+    add_geo_columns(df, cities)
+
+    log("Geo columns added.")
+
+    return df
+
+
+def clean(pipeline, df):
+    """Returns a clean copy of `df` without the columns in `skip-columns` and the rows that have `Exclude from
+    visualization` checked, and with a `Year` column."""
+    df_clean = df.drop(pipeline.settings["skip-columns"], axis=1)
+    df_clean = df_clean.drop(df_clean[df_clean["Exclude from visualization"] == True].index)
+
+    log("Clean copy of Dataframe created.")
+
+    def get_year(row):
+        try:
+            return pd.to_datetime(row.Date).year
+        except:
+            return None
+
+    df_clean["Year"] = df_clean.apply(lambda row: get_year(row), axis=1)
+    df_clean["Year"] = df_clean["Year"].fillna(0)
+    df_clean = df_clean.astype({"Year": int})
+    df_clean["Year"] = df_clean["Year"].replace(0, "")
+
+    log("Year column created.")
+
+    return df_clean
+
+
+def dataset(pipeline, df_clean):
+    """Writes the full dataset (if it does not match the existing one, see `data/manifest.json`)."""
+    full_dataset_file = Path(pipeline.settings["data-directory"]) / pipeline.settings["full-dataset"]
+
+    save_json(full_dataset_file, df_clean)
+
+    if full_dataset_file.as_posix() in changed_files:
+        log("Updated data written.")
+    else:
+        log("No updated data.")
+
+    return [str(full_dataset_file.absolute())]
+
+
+# PART II. VALUES DATASET
+
+
+def normalize(pipeline, df_clean):
+    """Replaces all the null values (dashes) in the clean dataset, in place (see `Stage.mutates`), and returns it."""
+    from .values import normalize_nulls
+
+    df = normalize_nulls(df_clean)
+
+    log("Cleaned dataset fixed.")
+
+    return df
+
+
+def values(pipeline, df):
+    """Writes the `value_counts` of all the columns (or the ones set in `values-columns`), one file per column and one
+    with all of them."""
+    from .values import iter_values
+
+    files_written = []
+
+    results = {}
+    for column, counts in iter_values(df, columns=pipeline.settings.get("values-columns")):
+        results[column] = counts
+
+        fp = save_result(column, counts, "values")
+        files_written.append(str(fp.absolute()))
+
+    log("Values generated from cleaned dataset.")
+
+    fp = save_result("full", results, "values")
+    files_written.append(str(fp.absolute()))
+
+    log("All values files saved.")
+
+    return files_written
+
+
+# PART III. PAIRINGS DATASET
+
+
+def pairings(pipeline, df):
+    """Writes the keys and values for all of the desired "filters" in `pairings`, one file per pairing and one with all
+    of them."""
+    from .pairings import get_pairings
+
+    files_written = []
+
+    results = get_pairings(df, [(x[0], x[1]) for x in pipeline.settings["pairings"]])
+
+    for cat, result in results.items():
+        fp = save_result(cat, result, "pairings")
+        files_written.append(str(fp.absolute()))
+
+    fp = save_result("full", results, "pairings")
+    files_written.append(str(fp.absolute()))
+
+    log("All pairings files saved.")
+
+    return files_written
+
+
+# PART IV. Network data
+
+NETWORK_MIN_DATE = datetime.datetime(year=1930, month=1, day=1)
+NETWORK_MAX_DATE = datetime.datetime(year=1940, month=12, day=31)
+
+
+def network_data(pipeline):
+    """Returns the clean DataFrame for the purposes of network data (from `urls.network`)."""
+    from .network import get_clean_network_data
+
+    return get_clean_network_data(
+        min_date=NETWORK_MIN_DATE,
+        max_date=NETWORK_MAX_DATE,
+        verbose=False,
+        url=pipeline.settings["urls"]["network"],
+    )
+
+
+def group_data(pipeline, df, previous=None):
+    """Returns the group data for the network data (see `get_group_data`). If `incremental-networks` is set, only the
+    venues whose rows changed since the last run are grouped again."""
+    from .network import get_changed_keys, get_group_data, get_venue_checksums, update_group_data
+
+    if not pipeline.settings.get("incremental-networks"):
+        return get_group_data(df), None
+
+    checksums = get_venue_checksums(df)
+    if previous is None:
+        return get_group_data(df), checksums
+
+    previous_group_data, previous_checksums = previous
+    venues = get_changed_keys(previous_checksums, checksums)
+
+    log(f"{len(venues)} of {len(checksums)} venues changed since the last run, updating their group data.")
+
+    return update_group_data(previous_group_data, df, venues), checksums
+
+
+def drop_unnamed(n):
+    return not "unnamed" in n.lower()
+
+
+def networks(pipeline, group_data_dict, previous=None):
+    """Creates the grouped networks, with and without unnamed performers, and adds the edges' `weights` and the nodes'
+    connected components. If `save-unnamed-networks` is set to False, only the networks without unnamed performers are
+    created. If `incremental-networks` is set, the networks of the last run are updated with the venues whose group data
+    changed."""
+    from .network import (
+        build_networks,
+        get_changed_keys,
+        get_components,
+        get_group_data_checksums,
+        update_networks,
+    )
+
+    variants = {"-no-unnamed-performers": drop_unnamed}
+    if pipeline.settings.get("save-unnamed-networks") != False:
+        variants = {"": None, **variants}
+
+    state = None
+    if pipeline.settings.get("incremental-networks"):
+        state = {
+            "variants": list(variants),
+            "venues": get_group_data_checksums(group_data_dict),
+        }
+
+    with track_peak_rss() as memory:
+        if state and previous and previous[1]["variants"] == state["variants"]:
+            venues = get_changed_keys(previous[1]["venues"], state["venues"])
+            log(f"Updating the networks of the last run with {len(venues)} changed venues.")
+            networks = update_networks(previous[0], group_data_dict, venues, variants=variants)
+        else:
+            networks = build_networks(group_data_dict, variants=variants)
+
+    if memory["peak"] is None:
+        memory_use = "peak memory use not measured, below the earlier peak of the process"
+    elif memory["before"] is None:
+        memory_use = f"peak memory use {memory['peak']} MB"
+    else:
+        memory_use = f"peak memory use {memory['peak']} MB, from {memory['before']} MB before to {memory['after']} MB after"
+
+    log(f"Grouped network data created (total of {len(networks.keys())} networks, {memory_use})")
+
+    # Add `weights` attribute for edges
+    for key in networks:
+        for edge in list(networks[key].edges):
+            networks[key].edges[edge]["weights"] = {}
+            for co_located, date_groups in networks[key].edges[edge]["coLocated"].items():
+                networks[key].edges[edge]["weights"]["dateGroups"] = len(date_groups)
+            networks[key].edges[edge]["weights"]["venues"] = len(
+                networks[key].edges[edge]["coLocated"]
+            )
+
+    log(f"Added weights attributes for all networks' edges.")
+
+    # Generating metadata for connected nodes in each network
+    for key in networks:
+        components = get_components(networks[key])
+
+        # Each component's nodes are listed once, in the graph's `networks` table, which the nodes refer to by `network_id`
+        networks[key].graph = {
+            **networks[key].graph,
+            "networks": {
+                str(network_id): component
+                for network_id, component in enumerate(components, start=1)
+            },
+        }
+
+        for network_id, component in enumerate(components, start=1):
+            for performer in component:
+                networks[key].nodes[performer]["connected"] = {
+                    "network": {"network_id": network_id, "size": len(component)}
+                }
+
+    log(f"Added unique connected nodes for each network.")
+
+    return networks, state
+
+
+def get_centralities(settings, keys):
+    from .analytics import get_centrality_modes
+
+    return {key: get_centrality_modes(key, settings["analytics"]) for key in keys}
+
+
+def analytics(pipeline, networks, previous=None):
+    """Returns the community algorithm and centrality data for each network (see `run_analytics`). If
+    `incremental-networks` is set, the exact betweenness and closeness centralities of the connected components that did
+    not change since the last run are reused."""
+    from .analytics import run_analytics
+
+    state = {} if pipeline.settings.get("incremental-networks") else None
+
+    results = run_analytics(
+        networks,
+        workers=pipeline.settings["analytics"]["workers"],
+        seed=pipeline.settings["analytics"]["seed"],
+        centralities=get_centralities(pipeline.settings, networks),
+        previous=previous[1] if state is not None and previous else None,
+        state=state,
+    )
+
+    return results, state
+
+
+def finalize(pipeline, networks, analytics):
+    """Adds the analytics, degree information and other meta information necessary for visualization to the networks
+    (in place)."""
+    import networkx as nx
+    from .analytics import add_analytics
+    from .network import compact_date_groups, get_degrees, get_found_dates
+
+    centralities = get_centralities(pipeline.settings, networks)
+
+    for key in networks:
+        add_analytics(networks[key], analytics[key])
+
+        # Recorded in the exported files, under `graph`
+        networks[key].graph["centralities"] = centralities[key]
+
+        degrees = {
+            node: {"degrees": degrees}
+            for node, degrees in get_degrees(networks[key]).items()
+        }
+        nx.set_node_attributes(networks[key], degrees)
+
+        for node in networks[key].nodes:
+            networks[key].nodes[node]["node_id"] = slugify(node)
+            networks[key].nodes[node]["category"] = "performer"
+            networks[key].nodes[node]["display"] = node
+
+        for edge in networks[key].edges:
+            networks[key].edges[edge]["edge_id"] = slugify_edge(edge[0], edge[1])
+            networks[key].edges[edge]["comments"] = []
+            networks[key].edges[edge]["general_comments"] = []
+
+            networks[key].edges[edge]["found"] = get_found_dates(
+                networks[key].edges[edge]["coLocated"]
+            )
+
+            networks[key].edges[edge]["comments"] = {
+                "venues": {},
+                "cities": {},
+                "revues": {},
+            }
+
+        if pipeline.settings.get("compact-date-groups"):
+            compact_date_groups(networks[key])
+
+        networks[key].finished = datetime.datetime.now()
+
+    log(f"Finalized meta data for each network.")
+
+    return networks
+
+
+def network(pipeline, df, group_data_dict, networks):
+    """Writes the full network dataset, the group data and each network's `live-co-occurrence` file."""
+    import networkx as nx
+
+    files_written = []
+
+    fp = save_result("full", df, "network")
+    files_written.append(str(fp.absolute()))
+
+    log("Updated full network data written.")
+
+    fp = save_result("group-data", group_data_dict, "network")
+    files_written.append(str(fp.absolute()))
+
+    log("Updated group data written.")
+
+    for key in networks:
+        file_name = f"live-co-occurrence-{key}"
+
+        data = nx.node_link_data(networks[key])
+        data["createdDate"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Networks reused from an earlier run are counted from the start of this one
+        diff = datetime.datetime.now() - max(networks[key].generated, pipeline.started)
+        data["timeToCreate"] = {
+            "minutes": diff.seconds // 60,
+            "seconds": diff.seconds % 60,
+            "totalInSeconds": diff.seconds,
+        }
+        data["days"] = re.findall(r"\d+", key)[0]
+
+        fp = save_result(file_name, data, f"network/live")
+        files_written.append(str(fp.absolute()))
+
+    log("Network data files written.")
+
+    return files_written
+
+
+def ego(pipeline, networks):
+    """Writes the ego network data for the 14-day separated dataset.
+
+    The network is stored once, in compressed form, and each node's ego network is read from it on the client (see
+    `get_ego_network` in `utils/network.py` for a reader)."""
+    from .network import get_ego_export
+
+    ego_networks = get_ego_export(networks["grouped-by-14-days-no-unnamed-performers"])
+
+    fp = save_result("ego-networks-14-days-no-unnamed", ego_networks, "network/live")
+
+    log(f"Saved ego network datafile.")
+
+    return [str(fp.absolute())]
+
+
+# Stage graph
+
+
+def get_source_params(key):
+    """Returns the parameters of a stage that reads the source at `urls.{key}`: the URL and the checksum of its current
+    snapshot (fetching or revalidating it, see `SourceCache.fetch`)."""
+
+    def params(settings):
+        url = settings["urls"][key]
+        return {"url": url, "sha256": get_source_cache().fetch(url)}
+
+    return params
+
+
+STAGES = [
+    Stage("fetch", fetch, params=get_source_params("live")),
+    Stage(
+        "geocode",
+        geocode,
+        inputs=["fetch"],
+        params=lambda settings: {"geocoding": settings["geocoding"]},
+        mutates=True,
+    ),
+    Stage(
+        "clean",
+        clean,
+        inputs=["geocode"],
+        params=lambda settings: {"skip-columns": settings["skip-columns"]},
+    ),
+    Stage(
+        "dataset",
+        dataset,
+        inputs=["clean"],
+        params=lambda settings: {
+            "data-directory": settings["data-directory"],
+            "full-dataset": settings["full-dataset"],
+        },
+        writes=True,
+    ),
+    Stage("normalize", normalize, inputs=["clean"], cache=False, mutates=True),
+    Stage(
+        "values",
+        values,
+        inputs=["normalize"],
+        params=lambda settings: {
+            "data-directory": settings["data-directory"],
+            "values-columns": settings.get("values-columns"),
+        },
+        writes=True,
+    ),
+    Stage(
+        "pairings",
+        pairings,
+        inputs=["normalize"],
+        params=lambda settings: {
+            "data-directory": settings["data-directory"],
+            "pairings": settings["pairings"],
+        },
+        writes=True,
+    ),
+    Stage(
+        "network-data",
+        network_data,
+        params=lambda settings: {
+            **get_source_params("network")(settings),
+            "min_date": NETWORK_MIN_DATE,
+            "max_date": NETWORK_MAX_DATE,
+        },
+    ),
+    Stage("group-data", group_data, inputs=["network-data"], incremental=True),
+    Stage(
+        "networks",
+        networks,
+        inputs=["group-data"],
+        params=lambda settings: {
+            "save-unnamed-networks": settings.get("save-unnamed-networks")
+        },
+        incremental=True,
+    ),
+    Stage(
+        "analytics",
+        analytics,
+        inputs=["networks"],
+        params=lambda settings: {
+            key: value
+            for key, value in settings["analytics"].items()
+            if not key == "workers"
+        },
+        incremental=True,
+    ),
+    Stage(
+        "finalize",
+        finalize,
+        inputs=["networks", "analytics"],
+        params=lambda settings: {
+            "compact-date-groups": settings.get("compact-date-groups")
+        },
+        cache=False,
+        mutates=True,
+    ),
+    Stage(
+        "network",
+        network,
+        inputs=["network-data", "group-data", "finalize"],
+        params=lambda settings: {"data-directory": settings["data-directory"]},
+        writes=True,
+    ),
+    Stage(
+        "ego",
+        ego,
+        inputs=["finalize"],
+        params=lambda settings: {"data-directory": settings["data-directory"]},
+        writes=True,
+    ),
+]
+
+
+def get_pipeline(settings, force=[]):
+    """Returns the pipeline of all the `STAGES`, with its store set up by the `stages` settings in `settings.yml`."""
+    options = settings.get("stages") or {}
+    store = StageStore(directory=options.get("directory", ".cache/stages"))
+    return Pipeline(STAGES, settings, store, force=force)
+
+
+def run_targets(settings, targets=TARGETS, force=[]):
+    """Runs the stages in `targets` (and whatever they depend on, see `Pipeline`), saves the output manifest and logs
+    the files written and changed. The changed files are also passed on to the GitHub workflow (in `GITHUB_OUTPUT`), so
+    that it only deploys those. Returns the pipeline."""
+    T = Timer()
+
+    pipeline = get_pipeline(settings, force=force)
+    results = pipeline.run(targets)
+
+    files_written = [file for target in targets for file in results[target]]
+
+    log(
+        f"Stages run: {', '.join(pipeline.ran) or '(none)'}. Stages reused: {', '.join(pipeline.reused) or '(none)'}.",
+        padding_bottom=True,
+    )
+
+    # Save the manifest of the files' checksums, which is used to skip unchanged files on the next run
+    get_manifest().save()
+
+    log("*************", padding_y=True)
+    log(f"Seconds to execute: {T.now}", padding_bottom=True)
+    log("Files written:", padding_bottom=True)
+    for file in files_written:
+        if file in write_stats:
+            log(
+                f"- {file} ({write_stats[file]['bytes']} bytes in {write_stats[file]['seconds']}s)"
+            )
+        else:
+            log("- " + file)
+    log("Files changed:", padding_y=True)
+    for file in changed_files:
+        log("- " + file)
+    if not changed_files:
+        log("(none)")
+    log("*************", padding_y=True)
+
+    if os.environ.get("GITHUB_OUTPUT"):
+        with open(os.environ["GITHUB_OUTPUT"], "a") as f:
+            f.write(f"changed={json.dumps(changed_files)}\n")
+
+    return pipeline
@@ -0,0 +1,156 @@
+from . import log, debug, settings, atomic_open, atomic_write_text
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, url2pathname, urlopen
+import pandas as pd
+import datetime
+import hashlib
+import json
+
+
+class SourceCache:
+    """A local, content-addressed snapshot cache for the CSV sources (the published Google Sheets).
+
+    Every URL is downloaded at most once per run. Snapshots are stored as `blobs/<sha256>` in
+    `directory` next to an `index.json` that keeps each URL's checksum and its `ETag` and
+    `Last-Modified` headers, which are used to revalidate the snapshot on the next run. Only the
+    latest snapshot of each URL is kept: the ones it replaces are deleted once it is stored. In
+    `offline` mode, the snapshots are used without touching the network. Local paths and `file://`
+    URLs are supported as well, which makes it possible to run the pipeline against a fixture.
+    """
+
+    def __init__(self, directory=".cache/sources", offline=False, timeout=60):
+        self.directory = Path(directory)
+        self.offline = offline
+        self.timeout = timeout
+
+        self.index_file = self.directory / "index.json"
+        if self.index_file.exists():
+            self.index = json.loads(self.index_file.read_text())
+        else:
+            self.index = {}
+
+        self._fetched = {}
+        self._frames = {}
+
+    def _blob(self, sha256):
+        return self.directory / "blobs" / sha256
+
+    def _store(self, url, content, headers={}):
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob = self._blob(sha256)
+        # Blobs are written atomically, but one cut short by an earlier version is still replaced
+        if not blob.exists() or blob.stat().st_size != len(content):
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_open(blob, "wb") as f:
+                f.write(content)
+
+        self.index[url] = {
+            "sha256": sha256,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        atomic_write_text(self.index_file, json.dumps(self.index, indent=2))
+        self._prune()
+
+        return sha256
+
+    def _prune(self):
+        """(internal) deletes the blobs (and any temporary files left by interrupted writes) that no URL in the index points to"""
+        blobs = self.directory / "blobs"
+        if not blobs.exists():
+            return
+
+        current = set(entry["sha256"] for entry in self.index.values())
+        for path in blobs.iterdir():
+            if path.is_file() and not path.name in current:
+                log(f"Removing superseded source snapshot {path.name}", verbose=debug)
+                path.unlink()
+
+    def _snapshot(self, url):
+        entry = self.index.get(url)
+        if entry and self._blob(entry["sha256"]).exists():
+            return entry["sha256"]
+        return None
+
+    def _download(self, url):
+        entry = self.index.get(url, {})
+
+        request = Request(url)
+        if self._snapshot(url):
+            if entry.get("etag"):
+                request.add_header("If-None-Match", entry["etag"])
+            if entry.get("last_modified"):
+                request.add_header("If-Modified-Since", entry["last_modified"])
+
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return self._store(url, response.read(), response.headers)
+        except HTTPError as e:
+            if e.code == 304:
+                log(f"Source not modified: {url}", verbose=debug)
+                return entry["sha256"]
+            raise
+
+    def fetch(self, url):
+        """Returns the checksum of the current snapshot of `url`, fetching or revalidating it if necessary."""
+        if url in self._fetched:
+            return self._fetched[url]
+
+        parsed = urlparse(url)
+        if parsed.scheme in ["http", "https"]:
+            if self.offline:
+                sha256 = self._snapshot(url)
+                if not sha256:
+                    raise RuntimeError(f"No snapshot of {url} is available in offline mode.")
+            else:
+                try:
+                    sha256 = self._download(url)
+                except URLError as e:
+                    sha256 = self._snapshot(url)
+                    if not sha256:
+                        raise
+                    log(f"Warning: Could not fetch {url} ({e}), using the snapshot from {self.index[url]['fetched']}.")
+        else:
+            path = Path(url2pathname(parsed.path)) if parsed.scheme == "file" else Path(url)
+            sha256 = self._store(url, path.read_bytes())
+
+        self._fetched[url] = sha256
+        return sha256
+
+    def path(self, url):
+        """Returns the path to the local snapshot of `url`."""
+        return self._blob(self.fetch(url))
+
+    def read_csv(self, url, **kwargs):
+        """Returns a DataFrame of the CSV at `url`. The parsed frame is kept in memory and a copy is returned on later calls."""
+        sha256 = self.fetch(url)
+
+        key = (sha256, json.dumps(kwargs, sort_keys=True, default=str))
+        if not key in self._frames:
+            self._frames[key] = pd.read_csv(self._blob(sha256), **kwargs)
+
+        return self._frames[key].copy()
+
+
+_source_cache = None
+
+
+def get_source_cache():
+    """Returns the source cache set up by the `source-cache` settings in `settings.yml`."""
+    global _source_cache
+
+    if _source_cache is None:
+        options = settings.get("source-cache", {})
+        _source_cache = SourceCache(
+            directory=options.get("directory", ".cache/sources"),
+            offline=options.get("offline", False),
+        )
+
+    return _source_cache
+
+
+def read_csv_source(url, **kwargs):
+    return get_source_cache().read_csv(url, **kwargs)
@@ -0,0 +1,253 @@
+from . import log, Timer, atomic_open, atomic_write_text
+from pathlib import Path
+import datetime
+import hashlib
+import json
+import pickle
+
+
+class Stage:
+    """One step of the pipeline (see `utils/pipeline.py`).
+
+    `run` is called with the running `Pipeline` and the outputs of the stages named in `inputs`, in that order.
+    `params` (a dictionary, or a function that returns one given the settings) holds everything else the output depends
+    on, like settings and the checksums of source files. Bump `version` when the stage's output changes for the same
+    inputs and parameters. Stages with `cache=False` are cheap enough to rerun whenever their output is needed. A stage
+    with `writes=True` writes files and returns the list of their paths; its cached output is only reused if the files
+    are still there. A stage with `mutates=True` changes (the outputs of) its inputs in place, so the pipeline forgets
+    them once it has run: any other stage that needs them gets them from the store again (or runs them again).
+
+    An `incremental` stage can update its last output rather than start over: `run` is also passed `previous`, which
+    is `(output, state)` from the last time it ran (or `None`), and returns `(output, state)`, where `state` is whatever
+    it needs to know about its output next time.
+    """
+
+    def __init__(
+        self,
+        name,
+        run,
+        inputs=[],
+        params={},
+        version=1,
+        cache=True,
+        writes=False,
+        incremental=False,
+        mutates=False,
+    ):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.params = params
+        self.version = version
+        self.cache = cache
+        self.writes = writes
+        self.incremental = incremental
+        self.mutates = mutates
+
+    def get_params(self, settings):
+        if callable(self.params):
+            return self.params(settings)
+        return self.params
+
+
+class StageStore:
+    """A local store of every stage's last output (pickled), together with the fingerprint it was made for (and the
+    state of incremental stages, see `Stage`)."""
+
+    def __init__(self, directory=".cache/stages"):
+        self.directory = Path(directory)
+
+        self.index_file = self.directory / "index.json"
+        if self.index_file.exists():
+            self.index = json.loads(self.index_file.read_text())
+        else:
+            self.index = {}
+
+    def _path(self, name):
+        return self.directory / f"{name}.pickle"
+
+    def _state_path(self, name):
+        return self.directory / f"{name}.state.pickle"
+
+    def load(self, name, fingerprint):
+        """Returns `(True, output)` if the stored output of stage `name` was made for `fingerprint`, and `(False, None)` otherwise."""
+        entry = self.index.get(name)
+        if not entry or entry["fingerprint"] != fingerprint or not self._path(name).exists():
+            return False, None
+
+        with open(self._path(name), "rb") as f:
+            return True, pickle.load(f)
+
+    def load_previous(self, name, code=None):
+        """Returns `(output, state)` of the last time stage `name` ran, whatever its fingerprint, or `None` (also if it
+        was not made by the code with the fingerprint `code`, when set)."""
+        if not name in self.index or not self._path(name).exists():
+            return None
+        if code is not None and self.index[name].get("code") != code:
+            return None
+        if not self._state_path(name).exists():
+            return None
+
+        with open(self._path(name), "rb") as f:
+            output = pickle.load(f)
+        with open(self._state_path(name), "rb") as f:
+            state = pickle.load(f)
+
+        return output, state
+
+    def save(self, name, fingerprint, output, state=None, code=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        with atomic_open(self._path(name), "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        if state is not None:
+            with atomic_open(self._state_path(name), "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        elif self._state_path(name).exists():
+            self._state_path(name).unlink()
+
+        self.index[name] = {
+            "fingerprint": fingerprint,
+            "code": code,
+            "saved": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        atomic_write_text(self.index_file, json.dumps(self.index, indent=2))
+
+
+_code_fingerprint = None
+
+
+def get_code_fingerprint():
+    """Returns a checksum of the `utils` package's source, so that any change to the code invalidates the stored outputs."""
+    global _code_fingerprint
+
+    if _code_fingerprint is None:
+        h = hashlib.sha256()
+        for path in sorted(Path(__file__).parent.glob("*.py")):
+            h.update(path.name.encode("utf-8"))
+            h.update(path.read_bytes())
+        _code_fingerprint = h.hexdigest()
+
+    return _code_fingerprint
+
+
+class Pipeline:
+    """Runs `stages` (a list of `Stage`) on demand, reusing the outputs in `store` (a `StageStore`) where it can.
+
+    Every stage's fingerprint is a checksum of its name, version and parameters, the code, and the fingerprints of its
+    inputs, so it changes whenever anything upstream changes. A stage whose stored output has the same fingerprint is
+    not run, and its output is only loaded if a stage that does run needs it. The stages in `force` (or all of them, if
+    it holds `"all"`) are run either way, and so is every stage downstream of them; incremental stages that are forced
+    start over (and so do the ones whose last output was made by other code).
+    """
+
+    def __init__(self, stages, settings, store, force=[]):
+        self.stages = {stage.name: stage for stage in stages}
+        self.settings = settings
+        self.store = store
+        self.started = datetime.datetime.now()
+
+        unknown = [name for name in force if name != "all" and not name in self.stages]
+        if unknown:
+            raise RuntimeError(
+                f"Unknown stage(s): {', '.join(unknown)}. Use one of: {', '.join(self.stages)} (or all)."
+            )
+
+        self.forced = set(self.stages) if "all" in force else self._with_dependents(force)
+
+        self.ran = []
+        self.reused = []
+
+        self._fingerprints = {}
+        self._outputs = {}
+
+    def _with_dependents(self, names):
+        """(internal) returns `names` together with every stage that depends on any of them (directly or not)"""
+        names = set(names)
+
+        found = True
+        while found:
+            found = False
+            for stage in self.stages.values():
+                if not stage.name in names and names.intersection(stage.inputs):
+                    names.add(stage.name)
+                    found = True
+
+        return names
+
+    def fingerprint(self, name):
+        if not name in self._fingerprints:
+            stage = self.stages[name]
+            key = {
+                "stage": name,
+                "version": stage.version,
+                "code": get_code_fingerprint(),
+                "params": stage.get_params(self.settings),
+                "inputs": {x: self.fingerprint(x) for x in stage.inputs},
+            }
+            self._fingerprints[name] = hashlib.sha256(
+                json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+            ).hexdigest()
+
+        return self._fingerprints[name]
+
+    def output(self, name):
+        """Returns the output of stage `name`, from the store if it is up to date and by running the stage otherwise."""
+        if name in self._outputs:
+            return self._outputs[name]
+
+        stage = self.stages[name]
+        fingerprint = self.fingerprint(name)
+
+        # A forced stage is only run once; if its output is needed again (see `Stage.mutates`), it comes from the store
+        if stage.cache and not (name in self.forced and not name in self.ran):
+            found, output = self.store.load(name, fingerprint)
+            if found and stage.writes and not all(Path(x).exists() for x in output):
+                log(f"Stage {name}: some of its files are missing, running it again.")
+                found = False
+
+            if found:
+                log(f"Stage {name}: up to date ({fingerprint[:10]}), reusing its output.")
+                if not name in self.ran and not name in self.reused:
+                    self.reused.append(name)
+                self._outputs[name] = output
+                return output
+
+        inputs = [self.output(x) for x in stage.inputs]
+
+        log(f"Stage {name}: running...", padding_top=True)
+        t = Timer()
+        if stage.incremental:
+            previous = None
+            if not name in self.forced:
+                previous = self.store.load_previous(name, code=get_code_fingerprint())
+            output, state = stage.run(self, *inputs, previous=previous)
+        else:
+            output, state = stage.run(self, *inputs), None
+        if stage.cache:
+            self.store.save(name, fingerprint, output, state=state, code=get_code_fingerprint())
+        log(f"Stage {name}: done. ({t.now}s)", padding_bottom=True)
+
+        self.ran.append(name)
+        self._outputs[name] = output
+        if stage.mutates:
+            for x in stage.inputs:
+                self._outputs.pop(x, None)
+        return output
+
+    def run(self, targets):
+        """Returns a dictionary of the output of each stage in `targets` (see `output`)."""
+        return {name: self.output(name) for name in targets}
+
+
+def add_force_argument(parser):
+    """Adds the `--force STAGE` option (see `Pipeline`) to the `argparse` parser `parser` (of `sync-data.py` and
+    `python -m utils`)."""
+    parser.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        metavar="STAGE",
+        help="run STAGE (and every stage downstream of it) even if its output is up to date; `all` runs every stage",
+    )
@@ -0,0 +1,50 @@
+from . import log
+import numpy as np
+
+
+def normalize_nulls(df, nulls=["–", "—"]):
+    """Replaces every cell in `df`'s object columns that is one of the dashes in `nulls` with an empty string, in place.
+
+    Columns without any dashes are left untouched, so the frame is never copied. Returns `df`."""
+    for column in df.columns:
+        if not df[column].dtype == object:
+            continue
+
+        values = df[column].to_numpy()
+        found = np.zeros(len(values), dtype=bool)
+        for null in nulls:
+            found |= values == null
+
+        if found.any():
+            df.loc[found, column] = ""
+
+    return df
+
+
+def count_values(series):
+    """Returns a dictionary of every value in `series` (as a string) and the number of times it occurs, sorted by value.
+
+    Missing values are not counted. Values that cannot be counted as they are (like lists) are counted as strings."""
+    try:
+        counts = series.value_counts()
+    except TypeError:
+        counts = series.dropna().map(str).value_counts()
+
+    counts = {str(value): count for value, count in counts.items()}
+    return dict(sorted(counts.items()))
+
+
+def iter_values(df, columns=None, verbose=False):
+    """Yields every column in `columns` (all of `df`'s columns if `None`) and its value counts (see `count_values`).
+
+    The counts are made one column at a time, so that they can be written out as they are generated."""
+    if columns is None:
+        columns = list(df.columns)
+
+    for column in columns:
+        if not column in df:
+            log(f"Warning: No column `{column}` to generate values for.")
+            continue
+
+        log(f"   ... {column}", verbose=verbose)
+        yield column, count_values(df[column])